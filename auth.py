@@ -1,9 +1,12 @@
+import hashlib
 import os
 
 from datetime import datetime
 
 from jose import jwt
-from jwt_utils import get_jwks, verify_jwt
+from cache_utils import ExpiringLRUCache
+from jwt_utils import JwksCache, verify_jwt
+from log_utils import get_logger
 from response_helpers import (
     InvalidTokenError,
     ExpiredTokenError
@@ -13,30 +16,50 @@ from response_helpers import (
 DEV_JWKS_URL = 'https://cognito-idp.us-east-1.amazonaws.com/us-east-1_c1urqyqMM/.well-known/jwks.json'
 JWKS_URL = os.environ.get('JWKS_URL', DEV_JWKS_URL)
 
+CLAIMS_CACHE_SIZE = int(os.environ.get('CLAIMS_CACHE_SIZE', 256))
+
+jwks_cache = JwksCache(JWKS_URL)
+# verified claims keyed by the sha256 of the id_token, each entry expires at the token's exp
+claims_cache = ExpiringLRUCache(maxsize=CLAIMS_CACHE_SIZE)
+
+logger = get_logger(__name__)
+
 
 def get_claims(event_body):
-    jwks = get_jwks(JWKS_URL)
     id_token = event_body['id_token']
+    token_digest = hashlib.sha256(id_token.encode()).hexdigest()
+
+    claims = claims_cache.get(token_digest)
+    if claims is not None:
+        return claims
 
-    if not verify_jwt(id_token, jwks):
-        print ('Invalid Token')
+    header = jwt.get_unverified_header(id_token)
+    jwks = jwks_cache.get(header.get('kid'))
+
+    if not verify_jwt(id_token, jwks, header):
+        logger.warning('Invalid token')
         raise InvalidTokenError
 
     claims = jwt.get_unverified_claims(id_token)
 
     if datetime.now().timestamp() > claims['exp']:
-        print ('Expired Token')
+        logger.warning('Expired token')
         raise ExpiredTokenError
 
+    claims_cache.set(token_digest, claims, expires_at=claims['exp'])
+
     return claims
 
 
+def get_claims_cache_stats():
+    return claims_cache.stats()
+
+
 def get_email(event_body):
     if os.getenv('IS_UNIT_TEST') == 'YES':
       return 'jasonh@ltccs.com'
     try:
         claims = get_claims(event_body)
         return claims["cognito:username"]
-    except Exception as e:
-        print ('Something is wrong with id_token')
-        pass
+    except Exception as err:
+        logger.warning('Something is wrong with id_token', error=str(err))
@@ -0,0 +1,91 @@
+import os
+import threading
+
+from metrics import instrument_boto_client
+
+
+_lock = threading.RLock()
+_instances = {}
+
+
+def _memoized(name, factory):
+    # boto3's default session isn't safe to use from several threads before it exists
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = factory()
+                _instances[name] = instance
+
+    return instance
+
+
+class LazyProxy:
+    """
+    Stands in for an object that is only built the first time it is used.
+
+    Lets modules keep their `table.query(...)` style globals without paying
+    for boto3 imports and client creation at import time.
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+
+    def _resolve(self):
+        return _memoized(self._name, self._factory)
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        return f'<LazyProxy {self._name}>'
+
+
+def get_dynamodb():
+    def _create():
+        import boto3
+        resource = boto3.resource('dynamodb', region_name='us-east-1', endpoint_url=os.getenv('ENDPOINT_URL'))
+        instrument_boto_client(resource.meta.client)
+        return resource
+
+    return _memoized('dynamodb', _create)
+
+
+def get_s3():
+    def _create():
+        import boto3
+        resource = boto3.resource('s3')
+        instrument_boto_client(resource.meta.client)
+        return resource
+
+    return _memoized('s3', _create)
+
+
+def get_ses():
+    def _create():
+        import boto3
+        return instrument_boto_client(boto3.client('ses', region_name='us-east-1'))
+
+    return _memoized('ses', _create)
+
+
+def get_kms():
+    def _create():
+        import boto3
+        return instrument_boto_client(boto3.client('kms'))
+
+    return _memoized('kms', _create)
+
+
+def get_sqs():
+    def _create():
+        import boto3
+        return instrument_boto_client(boto3.client('sqs', region_name='us-east-1'))
+
+    return _memoized('sqs', _create)
+
+
+def lazy_table(table_name):
+    return LazyProxy(f'table:{table_name}', lambda: get_dynamodb().Table(table_name))
@@ -0,0 +1,31 @@
+"""
+One-shot backfill of the portal summary table from the applications table.
+
+Safe to re-run: every summary row is rebuilt from its application item.
+
+    TABLE=medicaid-details PORTAL_SUMMARY_TABLE=... python backfill_portal_summary.py
+"""
+from utils import PORTAL_SUMMARY_FIELDS, build_portal_summary, parallel_scan, portal_summary_table, table
+
+
+def backfill():
+    names = {'#email': 'email', '#application_uuid': 'application_uuid'}
+    for ii, key in enumerate(PORTAL_SUMMARY_FIELDS):
+        names[f'#f{ii}'] = key
+
+    applications = parallel_scan(
+        table,
+        ProjectionExpression=', '.join(names),
+        ExpressionAttributeNames=names
+    )
+
+    with portal_summary_table.batch_writer() as batch:
+        for item in applications:
+            batch.put_item(Item=build_portal_summary(item))
+
+    return len(applications)
+
+
+if __name__ == '__main__':
+    count = backfill()
+    print(f'Backfilled {count} portal summary rows')
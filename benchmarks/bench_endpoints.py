@@ -0,0 +1,349 @@
+"""
+Per-endpoint latency, throughput and allocations of the lambda handler,
+without AWS.
+
+Every request goes through the real `handler` (Mangum -> FastAPI -> route)
+as an API Gateway event. DynamoDB, S3, KMS, SES and Stripe are replaced by
+the in-memory stand-ins of local_aws, which sleep for a configurable
+latency per call.
+
+    python benchmarks/bench_endpoints.py                         # default latencies
+    python benchmarks/bench_endpoints.py --no-latency            # cpu time only
+    python benchmarks/bench_endpoints.py --latency dynamodb=8 --latency stripe=300
+    python benchmarks/bench_endpoints.py --only get-details --iterations 500
+    python benchmarks/bench_endpoints.py --json after.json --baseline before.json
+
+--json results of two commits can be compared with --baseline.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# get_email returns this user when IS_UNIT_TEST is set
+EMAIL = 'jasonh@ltccs.com'
+os.environ.update({
+    'IS_UNIT_TEST': 'YES',
+    'INTERNAL_USERS': EMAIL,
+    'USER_FILES_BUCKET': 'bench-bucket',
+    'METRICS_BACKEND': 'memory',
+    'LOG_LEVEL': 'WARNING',
+    'LOG_DEBUG_SAMPLE_RATE': '0',
+    'AWS_LAMBDA_FUNCTION_NAME': 'bench',
+    'STRIPE_API_KEY': base64.b64encode(b'sk_test_bench').decode(),
+    'CHECKOUT_SESSION_WEBHOOK_SECRET': base64.b64encode(b'whsec_bench').decode(),
+})
+os.environ.pop('PAYMENT_QUEUE_URL', None)
+os.environ.pop('LOCAL_PAYMENT_QUEUE_DIR', None)
+
+import local_aws  # noqa: E402  (needs the environment above, lives next to the tests)
+import metrics  # noqa: E402
+import payment_queue  # noqa: E402
+import utils  # noqa: E402
+
+from bench_form_schema import build_item  # noqa: E402
+from bench_import import summarize as summarize_import  # noqa: E402
+from config import API_V1_STR  # noqa: E402
+from handler import handler  # noqa: E402
+
+
+DEFAULT_LATENCY_MS = {'dynamodb': 5, 's3': 15, 'kms': 10, 'ses': 20, 'stripe': 150}
+APPLICATION_UUID = 'bench-application'
+UPLOAD_APPLICATION_UUID = 'bench-upload-application'
+DETAIL_UUID = 'bench-detail'
+STANDARD_PRICE_ID = 'price_bench_standard'
+
+
+class LambdaContext:
+    aws_request_id = 'bench'
+
+
+def seed(args):
+    """The tables and bucket one user with `args.applications` applications would have."""
+    documents = []
+    for ii in range(args.documents):
+        document_name = f'document_{ii}.png'
+        key = utils.get_file_key(EMAIL, APPLICATION_UUID, 'identity', document_name)
+        utils.s3.meta.client.put_object(Bucket=utils.BUCKET_NAME, Key=key, Body=os.urandom(args.file_kb * 1024))
+        documents.append({
+            'uuid': f'document-{ii}',
+            'document_name': document_name,
+            'document_type': 'identity',
+            'associated_medicaid_detail_uuid': DETAIL_UUID,
+            's3_location': utils.get_s3_location(key),
+            'tags': []
+        })
+
+    for ii in range(args.applications):
+        application_uuid = APPLICATION_UUID if ii == 0 else f'{APPLICATION_UUID}-{ii}'
+        item = build_item(args.extra_keys)
+        for detail in item.values():
+            detail.update(created_date='2024-01-01T00:00:00', updated_date='2024-01-01T00:00:00')
+        item.update({
+            'email': EMAIL,
+            'application_uuid': application_uuid,
+            'application_name': {'value': f'Application {ii}'},
+            'currentScreenName': 'intake',
+            'documents': list(documents)
+        })
+        utils.table.put_item(Item=item)
+
+    utils.table.put_item(Item={'email': EMAIL, 'application_uuid': UPLOAD_APPLICATION_UUID, 'documents': []})
+
+    with utils.portal_summary_table.batch_writer() as batch:
+        for ii in range(args.users):
+            batch.put_item(Item=utils.build_portal_summary({
+                'email': f'user{ii}@example.com',
+                'application_uuid': f'application-{ii}',
+                'applicant_info.first_name': {'value': f'First{ii}'},
+                'applicant_info.last_name': {'value': f'Last{ii}'},
+            }))
+
+    utils.import_custom_prices({f'user{ii}@example.com': f'price_custom_{ii}' for ii in range(args.custom_prices)}, EMAIL)
+    utils.stripe_price_table.put_item(Item={'price_id': STANDARD_PRICE_ID, 'standard': 1, 'price': 9900})
+    # AWS_LAMBDA_FUNCTION_NAME is set, so the in-memory queue has to be chosen explicitly
+    payment_queue._queue = payment_queue.LocalQueue()
+    metrics.collector.clear()
+
+
+def scenarios(args):
+    """name -> (path, body, query string parameters, headers)."""
+    keys = [key for key in build_item(0) if not utils.is_list_type(key)]
+    file_contents = 'data:image/png;base64,' + base64.b64encode(os.urandom(args.file_kb * 1024)).decode()
+    checkout_event = {
+        'id': 'evt_bench',
+        'type': 'checkout.session.completed',
+        'data': {'object': {
+            'customer_email': EMAIL,
+            'client_reference_id': APPLICATION_UUID,
+            'payment_intent': 'pi_bench'
+        }}
+    }
+
+    return {
+        'get-applications': ('/get-applications', {}, None, None),
+        'get-applications-summary': ('/get-applications', {'summary': True}, None, None),
+        'get-details': ('/get-details', {'application_uuid': APPLICATION_UUID}, None, None),
+        'update-details': ('/update-details', {
+            'application_uuid': APPLICATION_UUID,
+            'key_to_update': keys[0],
+            'value_to_update': 'updated'
+        }, None, None),
+        'update-details-batch': ('/update-details-batch', {
+            'application_uuid': APPLICATION_UUID,
+            'updates': [{'key_to_update': key, 'value_to_update': 'updated'} for key in keys[:10]]
+        }, None, None),
+        'upload-file': ('/upload-file', {
+            'application_uuid': UPLOAD_APPLICATION_UUID,
+            'associated_medicaid_detail_uuid': DETAIL_UUID,
+            'document_type': 'identity',
+            'files': [{'file_name': 'upload.png', 'file_contents': file_contents}]
+        }, None, None),
+        'get-files-url': ('/get-files', {
+            'application_uuid': APPLICATION_UUID, 'uuid': DETAIL_UUID, 'mode': 'url'
+        }, None, None),
+        'get-files-inline': ('/get-files', {
+            'application_uuid': APPLICATION_UUID, 'uuid': DETAIL_UUID, 'mode': 'inline'
+        }, None, None),
+        'get-user': ('/get-user', {'email': EMAIL}, None, None),
+        'get-users': ('/get-users', {}, {'order_by': 'email', 'page': '1', 'page_size': '25'}, None),
+        'get-custom-prices': ('/get-custom-prices', {'page_size': 50}, None, None),
+        'get-price': ('/get-price', {}, None, None),
+        'create-payment-session': ('/create-payment-session', {
+            'price_id': STANDARD_PRICE_ID, 'application_uuid': APPLICATION_UUID
+        }, None, None),
+        'completed-checkout-session': (
+            '/completed-checkout-session', checkout_event, None, {'Stripe-Signature': 'bench'}
+        ),
+    }
+
+
+def build_event(path, body, query, headers):
+    path = API_V1_STR + path
+    headers = dict({'content-type': 'application/json', 'host': 'bench.local'}, **(headers or {}))
+
+    return {
+        'resource': path,
+        'path': path,
+        'httpMethod': 'POST',
+        'headers': headers,
+        'multiValueHeaders': {key: [val] for key, val in headers.items()},
+        'queryStringParameters': query,
+        'multiValueQueryStringParameters': {key: [val] for key, val in query.items()} if query else None,
+        'requestContext': {
+            'resourcePath': path,
+            'httpMethod': 'POST',
+            'path': path,
+            'stage': 'bench',
+            'identity': {'sourceIp': '127.0.0.1'}
+        },
+        'body': json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+
+def invoke(event):
+    resp = handler(event, LambdaContext())
+    # routes report most errors as a response dict with its own statusCode
+    if resp['statusCode'] != 200 or '"statusCode":4' in resp['body'] or '"statusCode":5' in resp['body']:
+        raise RuntimeError(f'{event["path"]} failed: {resp["statusCode"]} {resp["body"][:300]}')
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure_latency(event, iterations):
+    # one request at a time, like a lambda container handles them
+    durations = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        request_start = time.perf_counter()
+        invoke(event)
+        durations.append((time.perf_counter() - request_start) * 1000)
+    wall = time.perf_counter() - start
+
+    ordered = sorted(durations)
+
+    return {
+        'p50_ms': percentile(ordered, 0.5),
+        'p95_ms': percentile(ordered, 0.95),
+        'p99_ms': percentile(ordered, 0.99),
+        'mean_ms': statistics.mean(ordered),
+        'throughput_rps': len(ordered) / wall
+    }
+
+
+def measure_allocations(event, iterations):
+    """Median peak and retained bytes traced while handling one request."""
+    peaks = []
+    retained = []
+    for _ in range(iterations):
+        tracemalloc.start()
+        invoke(event)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+        retained.append(current)
+
+    return {
+        'alloc_peak_kib': statistics.median(peaks) / 1024,
+        'alloc_retained_kib': statistics.median(retained) / 1024
+    }
+
+
+def dependency_calls(endpoint, requests):
+    summary = metrics.collector.summary().get(API_V1_STR + endpoint, {}).get('dependencies', {})
+
+    return {name: stats['count'] / requests for name, stats in summary.items()}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    print(f'{"endpoint":28}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"req/s":>9}{"peak KiB":>10}  calls per request')
+    for name, result in results['endpoints'].items():
+        calls = ', '.join(f'{dep} {count:g}' for dep, count in sorted(result['calls_per_request'].items()))
+        print(f'{name:28}{result["p50_ms"]:9.2f}{result["p95_ms"]:9.2f}{result["p99_ms"]:9.2f}'
+              f'{result["throughput_rps"]:9.1f}{result["alloc_peak_kib"]:10.1f}  {calls}')
+
+        previous = (baseline or {}).get('endpoints', {}).get(name)
+        if previous:
+            deltas = [
+                f'{key[:-3]} {(result[key] / previous[key] - 1) * 100:+.0f}%'
+                for key in ('p50_ms', 'p95_ms', 'p99_ms') if previous[key]
+            ]
+            print(f'{"":28}vs {baseline["meta"].get("revision") or "baseline"}: ' + ', '.join(deltas))
+
+    if results.get('import'):
+        print(f'cold import of handler: {results["import"]["total_ms"]:.1f} ms')
+
+
+def parse_latency(values, no_latency):
+    latency = {name: 0 for name in DEFAULT_LATENCY_MS} if no_latency else dict(DEFAULT_LATENCY_MS)
+    for value in values:
+        name, ms = value.split('=')
+        latency[name] = float(ms)
+
+    return latency
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=100, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per endpoint before timing')
+    parser.add_argument('--alloc-iterations', type=int, default=10, help='requests per endpoint traced for allocations')
+    parser.add_argument('--latency', action='append', default=[], metavar='SERVICE=MS',
+                        help=f'injected latency per call, defaults: {DEFAULT_LATENCY_MS}')
+    parser.add_argument('--no-latency', action='store_true', help='inject no latency at all')
+    parser.add_argument('--only', action='append', help='endpoint to run, can be repeated')
+    parser.add_argument('--applications', type=int, default=3, help='applications of the benchmark user')
+    parser.add_argument('--extra-keys', type=int, default=20, help='free-form answers per section of each application')
+    parser.add_argument('--documents', type=int, default=5, help='documents of each application')
+    parser.add_argument('--file-kb', type=int, default=200, help='size of every document and upload')
+    parser.add_argument('--users', type=int, default=500, help='rows of the portal summary table')
+    parser.add_argument('--custom-prices', type=int, default=200)
+    parser.add_argument('--import-runs', type=int, default=3, help='cold imports to time, 0 to skip')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results --json wrote earlier, to print the differences')
+    args = parser.parse_args()
+
+    latency = parse_latency(args.latency, args.no_latency)
+    local_aws.install(latency)
+    seed(args)
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'latency_ms': latency,
+            'config': {key: val for key, val in vars(args).items() if key not in ('json', 'baseline', 'latency')}
+        },
+        'endpoints': {}
+    }
+
+    for name, (path, body, query, headers) in scenarios(args).items():
+        if args.only and name not in args.only:
+            continue
+
+        event = build_event(path, body, query, headers)
+        for _ in range(args.warmup):
+            invoke(event)
+
+        metrics.collector.clear()
+        result = measure_latency(event, args.iterations)
+        result['calls_per_request'] = dependency_calls(path, args.iterations)
+        result.update(measure_allocations(event, args.alloc_iterations))
+        results['endpoints'][name] = result
+
+    if args.import_runs:
+        results['import'] = summarize_import(ROOT, args.import_runs)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
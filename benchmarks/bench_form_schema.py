@@ -0,0 +1,102 @@
+"""
+Key validation, list detection and portal grouping against the compiled
+FORM_SCHEMA versus the previous per-call SECTION_LIST scans.
+
+    python benchmarks/bench_form_schema.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import SECTION_LIST
+from form_schema import BASE_KEYS, FORM_SCHEMA, LIST_TYPES
+
+
+def legacy_check_key_validity(key):
+    inputs = list(BASE_KEYS)
+
+    for _inputs in SECTION_LIST:
+        inputs += _inputs['inputs']
+
+    if key in inputs:
+        return True
+
+    for _key in inputs:
+        if key.startswith(_key):
+            return True
+
+
+def legacy_is_list_type(key_to_update):
+    array_types = list(LIST_TYPES)
+
+    return key_to_update in array_types
+
+
+def legacy_group_attributes(item):
+    inputs = []
+    for _inputs in SECTION_LIST:
+        inputs += _inputs['inputs']
+
+    result = []
+    for key in inputs:
+        if key in item:
+            result.append((key, item.pop(key)))
+        else:
+            _item = dict(item)
+            for _key in _item:
+                if _key.startswith(key):
+                    result.append((_key, item.pop(_key)))
+
+    return result
+
+
+def build_item(extra_keys):
+    """
+    An application item that answered every other input, plus `extra_keys`
+    keys under each of the free-form prefixes and a section we don't know.
+    """
+    item = {}
+    inputs = [key for section in SECTION_LIST for key in section['inputs'] if not key.endswith('.')]
+    for key in inputs[::2]:
+        item[key] = {'value': f'answer to {key}', 'uuid': 'x' * 32}
+    for ii in range(extra_keys):
+        item[f'request_questions.custom_question_{ii}'] = {'value': ii}
+        item[f'verification_documents_info.document_{ii}'] = {'value': ii}
+        item[f'unknown_section.key_{ii}'] = {'value': ii}
+
+    return item
+
+
+def timeit(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    keys = list(build_item(20)) + ['not.a.known_key', 'general.vehicles']
+    print(f'{"":32}{"legacy us":>12}{"schema us":>12}')
+
+    legacy = timeit(lambda: [legacy_check_key_validity(key) for key in keys], iterations) / len(keys)
+    compiled = timeit(lambda: [FORM_SCHEMA.is_valid_key(key) for key in keys], iterations) / len(keys)
+    print(f'{"check_key_validity (per key)":32}{legacy:12.2f}{compiled:12.2f}')
+
+    legacy = timeit(lambda: [legacy_is_list_type(key) for key in keys], iterations) / len(keys)
+    compiled = timeit(lambda: [FORM_SCHEMA.is_list_type(key) for key in keys], iterations) / len(keys)
+    print(f'{"is_list_type (per key)":32}{legacy:12.2f}{compiled:12.2f}')
+
+    for extra_keys in (0, 50, 500):
+        item = build_item(extra_keys)
+        expected = legacy_group_attributes(dict(item))
+        assert expected == [(key, val) for key, _, val in FORM_SCHEMA.group_attributes(dict(item))]
+
+        legacy = timeit(lambda: legacy_group_attributes(dict(item)), iterations)
+        compiled = timeit(lambda: FORM_SCHEMA.group_attributes(dict(item)), iterations)
+        label = f'get_user grouping ({len(item)} attrs)'
+        print(f'{label:32}{legacy:12.2f}{compiled:12.2f}')
@@ -0,0 +1,92 @@
+"""
+Cold import profile of the lambda handler, from `python -X importtime`.
+
+    python benchmarks/bench_import.py                    # current tree
+    python benchmarks/bench_import.py --compare <rev>    # current tree vs a git revision
+
+Every run imports `handler` in a fresh interpreter and reports the median of
+the total import time and of the modules handler imports directly.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def profile_import(cwd, module='handler'):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd, env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        universal_newlines=True, check=True
+    )
+
+    # children are printed before their parent and indented two spaces per level,
+    # keep `module` itself and the modules it imports directly
+    modules = {}
+    children = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, raw_name = line.split('|')
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[raw_name.strip()] = int(cumulative_us)
+        elif depth == 0:
+            if raw_name.strip() == module:
+                modules = dict(children)
+                modules[module] = int(cumulative_us)
+            children = {}
+
+    return modules
+
+
+def summarize(cwd, runs, module='handler'):
+    profiles = [profile_import(cwd, module) for _ in range(runs)]
+    names = set().union(*profiles)
+    medians = {name: statistics.median(profile.get(name, 0) for profile in profiles) for name in names}
+
+    return {
+        'total_ms': medians.get(module, 0) / 1000,
+        'top_level_ms': {
+            name: us / 1000 for name, us in sorted(medians.items(), key=lambda kv: -kv[1])[:15]
+        }
+    }
+
+
+def print_report(label, result):
+    print(f'{label}: import handler {result["total_ms"]:.1f} ms')
+    for name, ms in result['top_level_ms'].items():
+        print(f'    {ms:8.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--compare', help='git revision to compare the current tree against')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = {'current': summarize(ROOT, args.runs)}
+
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            worktree = os.path.join(tmp, 'tree')
+            subprocess.run(['git', 'worktree', 'add', '--detach', worktree, args.compare],
+                           cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                results[args.compare] = summarize(worktree, args.runs)
+            finally:
+                subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=ROOT, check=True)
+
+    for label, result in results.items():
+        print_report(label, result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,86 @@
+"""
+Verifications per second of jwt_utils.verify_jwt before and after the per-kid
+verifier registry.
+
+    python benchmarks/bench_verify_jwt.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import rsa
+
+from jose import jwt, jwk
+from jose.utils import base64url_decode
+
+from jwt_utils import verify_jwt
+
+
+def build_token_and_jwks(kid='bench-key', extra_keys=2):
+    keys = []
+    for ii in range(extra_keys):
+        _, other_private = rsa.newkeys(2048)
+        other = jwk.construct(other_private.save_pkcs1().decode(), 'RS256').public_key().to_dict()
+        other.update({'kid': f'other-{ii}', 'alg': 'RS256', 'use': 'sig'})
+        keys.append(other)
+
+    _, private_key = rsa.newkeys(2048)
+    private_pem = private_key.save_pkcs1().decode()
+    public = jwk.construct(private_pem, 'RS256').public_key().to_dict()
+    public.update({'kid': kid, 'alg': 'RS256', 'use': 'sig'})
+    keys.append(public)
+
+    token = jwt.encode(
+        {'cognito:username': 'bench@example.com', 'exp': int(time.time()) + 3600},
+        private_pem,
+        algorithm='RS256',
+        headers={'kid': kid}
+    )
+
+    return token, {'keys': keys}
+
+
+def legacy_get_hmac_key(token, jwks):
+    kid = jwt.get_unverified_header(token).get("kid")
+    for key in jwks.get("keys", []):
+        if key.get("kid") == kid:
+            return key
+
+
+def legacy_verify_jwt(token, jwks):
+    hmac_key = legacy_get_hmac_key(token, jwks)
+
+    if not hmac_key:
+        raise ValueError("No pubic key found!")
+
+    hmac_key = jwk.construct(legacy_get_hmac_key(token, jwks))
+
+    message, encoded_signature = token.rsplit(".", 1)
+
+    decoded_signature = base64url_decode(encoded_signature.encode())
+
+    return hmac_key.verify(message.encode(), decoded_signature)
+
+
+def run(func, token, jwks, iterations):
+    assert func(token, jwks)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(token, jwks)
+    elapsed = time.perf_counter() - start
+
+    return iterations / elapsed
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    token, jwks = build_token_and_jwks()
+
+    before = run(legacy_verify_jwt, token, jwks, iterations)
+    after = run(verify_jwt, token, jwks, iterations)
+
+    print(f'legacy verify_jwt:   {before:10.1f} verifications/s')
+    print(f'registry verify_jwt: {after:10.1f} verifications/s')
+    print(f'speedup:             {after / before:10.2f}x')
@@ -13,3 +13,12 @@ aws dynamodb create-table \
     --endpoint-url http://localhost:8000
 
 
+aws dynamodb create-table \
+    --table-name portal-summary-unit-test \
+    --attribute-definitions \
+        AttributeName=email,AttributeType=S \
+        AttributeName=application_uuid,AttributeType=S \
+    --key-schema AttributeName=email,KeyType=HASH AttributeName=application_uuid,KeyType=RANGE \
+    --provisioned-throughput ReadCapacityUnits=1,WriteCapacityUnits=1 \
+    --region us-east-1 \
+    --endpoint-url http://localhost:8000
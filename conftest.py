@@ -0,0 +1,25 @@
+import pytest
+
+
+# get_email returns this user when IS_UNIT_TEST is set
+UNIT_TEST_EMAIL = 'jasonh@ltccs.com'
+
+
+@pytest.fixture
+def stand_ins(monkeypatch):
+    """The in-memory DynamoDB, S3, KMS, SES and Stripe of local_aws, without latency. Yields the DynamoDB."""
+    import aws_clients
+    import local_aws
+    import utils
+
+    monkeypatch.setenv('IS_UNIT_TEST', 'YES')
+    monkeypatch.setenv('INTERNAL_USERS', UNIT_TEST_EMAIL)
+    monkeypatch.setattr(local_aws, 'LATENCY_MS', {})
+    utils.invalidate_price_cache()
+    utils.download_url_cache.clear()
+    dynamodb = local_aws.install()
+    yield dynamodb
+    aws_clients._instances.clear()
+    utils._stripe = None
+    utils.invalidate_price_cache()
+    utils.download_url_cache.clear()
@@ -0,0 +1,64 @@
+#!/usr/bin/env bash
+# Deploy the payment queue and worker of a stage and point its api lambda at the queue.
+#
+#   ./deploy_payment_worker.sh sps-dev-1
+#
+# The worker runs with the table names, stripe key and email settings of the
+# api lambda. Until PAYMENT_QUEUE_URL is set there the webhook keeps finishing
+# payments inline.
+set -euo pipefail
+
+STAGE=$1
+REGION=us-east-1
+API_FUNCTION="turbocaid-proxy--$STAGE"
+STACK="turbocaid-payment-worker--$STAGE"
+BUILD_DIR=.aws-sam/payment-worker
+
+aws lambda get-function-configuration --region "$REGION" --function-name "$API_FUNCTION" > api-config.json
+
+api_setting() {
+    python -c "
+import json, sys
+config = json.load(open('api-config.json'))
+if sys.argv[1] == 'Role':
+    print(config['Role'].split('/')[-1])
+else:
+    print(config.get('Environment', {}).get('Variables', {}).get(sys.argv[1]) or sys.argv[2])
+" "$@"
+}
+
+sam build --template-file payment_worker.yaml --build-dir "$BUILD_DIR"
+sam deploy \
+    --region "$REGION" \
+    --template-file "$BUILD_DIR/template.yaml" \
+    --stack-name "$STACK" \
+    --s3-bucket "lambda-source-code-$STAGE" \
+    --s3-prefix payment-worker \
+    --capabilities CAPABILITY_IAM \
+    --no-fail-on-empty-changeset \
+    --parameter-overrides \
+        "Stage=$STAGE" \
+        "ApiRoleName=$(api_setting Role '')" \
+        "TableName=$(api_setting TABLE medicaid-details)" \
+        "PaymentDetailsTableName=$(api_setting STRIPE_PAYMENT_DETAILS_TABLE StripePaymentDetails-sps-dev-1)" \
+        "PortalSummaryTableName=$(api_setting PORTAL_SUMMARY_TABLE TurbocaidPortalSummary-sps-dev-1)" \
+        "StripeApiKey=$(api_setting STRIPE_API_KEY '')" \
+        "SenderEmail=$(api_setting SENDER_EMAIL ltclakewooddev@gmail.com)" \
+        "ToEmails=$(api_setting TO_EMAILS jason.5001001@gmail.com)"
+
+QUEUE_URL=$(aws cloudformation describe-stacks --region "$REGION" --stack-name "$STACK" \
+    --query "Stacks[0].Outputs[?OutputKey=='PaymentQueueUrl'].OutputValue" --output text)
+
+python -c "
+import json, sys
+config = json.load(open('api-config.json'))
+variables = config.get('Environment', {}).get('Variables', {})
+variables['PAYMENT_QUEUE_URL'] = sys.argv[1]
+json.dump({'Variables': variables}, open('api-environment.json', 'w'))
+" "$QUEUE_URL"
+
+# the code update of the same build may still be in progress
+aws lambda wait function-updated --region "$REGION" --function-name "$API_FUNCTION"
+aws lambda update-function-configuration --region "$REGION" --function-name "$API_FUNCTION" \
+    --environment file://api-environment.json > /dev/null
+rm -f api-config.json api-environment.json
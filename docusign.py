@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+
+import http_client
+
+from requests.auth import HTTPBasicAuth
+
+from secrets_provider import get_docusign_credentials
+
+
+DS_AUTH_URL = os.environ.get('DS_AUTH_URL', 'https://account-d.docusign.com/oauth/token')
+# seconds before the returned expires_in at which a token is no longer handed out
+DS_TOKEN_EXPIRY_MARGIN = int(os.environ.get('DS_TOKEN_EXPIRY_MARGIN', 300))
+
+
+class DocuSignTokenManager:
+    """
+    Access token obtained from the DocuSign refresh token, shared by every
+    request in the container until shortly before it expires.
+    """
+
+    def __init__(self, auth_url=DS_AUTH_URL, expiry_margin=DS_TOKEN_EXPIRY_MARGIN):
+        self.auth_url = auth_url
+        self.expiry_margin = expiry_margin
+        self._access_token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def get_access_token(self):
+        if self._access_token and time.time() < self._expires_at:
+            return self._access_token
+
+        with self._lock:
+            # another thread may have refreshed it while we waited
+            if self._access_token and time.time() < self._expires_at:
+                return self._access_token
+
+            ds_credentials = get_docusign_credentials()
+            data = {
+                'grant_type': 'refresh_token',
+                'refresh_token': ds_credentials['refresh_token']
+            }
+            auth = HTTPBasicAuth(ds_credentials['client_id'], ds_credentials['client_secret'])
+
+            resp = http_client.post(self.auth_url, dependency='docusign', data=data, auth=auth)
+            resp.raise_for_status()
+            resp = resp.json()
+
+            self._access_token = resp['access_token']
+            self._expires_at = time.time() + int(resp.get('expires_in', 3600)) - self.expiry_margin
+
+            return self._access_token
+
+    def invalidate(self):
+        with self._lock:
+            self._access_token = None
+            self._expires_at = 0
+
+
+token_manager = DocuSignTokenManager()
+
+
+def get_envelope_recipients(envelope_id):
+    account_id = os.getenv('DS_ACCOUNT_ID')
+    base_url = os.getenv('DS_BASE_URL')
+    url = base_url + f'/restapi/v2.1/accounts/{account_id}/envelopes/{envelope_id}/recipients'
+    params = {
+        'include': 'recipients'
+    }
+
+    for attempt in range(2):
+        headers = {
+            'Authorization': f'Bearer {token_manager.get_access_token()}'
+        }
+        resp = http_client.get(url, dependency='docusign', headers=headers, params=params)
+        # a token revoked before its expiry: drop it and try once more with a new one
+        if resp.status_code == 401 and attempt == 0:
+            token_manager.invalidate()
+            continue
+
+        return resp.json()
@@ -0,0 +1,146 @@
+import re
+
+from config import SECTION_LIST
+
+
+# keys written by the SPA that are not part of any form section
+BASE_KEYS = [
+    "email",
+    "submitted_date",
+    "applicant_info.first_name",
+    "applicant_info.last_name",
+    "sidebarHistory",
+    "documents",
+    "application_uuid",
+    "currentScreenName",
+    "application_name"
+]
+
+LIST_TYPES = [
+    'contacts',
+    'previous_addresses',
+    'documents',
+    'general.vehicles',
+    'general-vehicles',
+    'employment_income.income_employment_details',
+    'employment_income-income_employment_details',
+    'insurance_policies.insurance_policies_details',
+    'insurance_policies-insurance_policies_details',
+    'general.properties',
+    'general-properties',
+    'general.property_proceeds',
+    'general-property_proceeds',
+    'financials.account_details',
+    'financials-account_details',
+    'financials.life_insurance_stocks_details',
+    'financials-life_insurance_stocks_details'
+]
+
+_END = ''
+
+
+class FormSchema:
+    """
+    SECTION_LIST compiled once at import time.
+
+    Every known key (section inputs and BASE_KEYS) is stored in a character
+    trie. The trie is rendered into one anchored regex whose greedy match is
+    the longest known key prefixing a given key, so both exact and prefix
+    lookups cost O(len(key)) instead of a scan over every input.
+    """
+
+    def __init__(self, section_list, base_keys, list_types):
+        self.inputs = []
+        self.key_to_section = {}
+        for section in section_list:
+            for key in section['inputs']:
+                if key not in self.key_to_section:
+                    self.key_to_section[key] = section['section']
+                    self.inputs.append(key)
+
+        self.exact_keys = frozenset(base_keys) | frozenset(self.inputs)
+        self.list_types = frozenset(list_types)
+
+        # section inputs keep their position so grouping can follow SECTION_LIST order
+        index = {key: None for key in base_keys}
+        index.update((key, idx) for idx, key in enumerate(self.inputs))
+
+        trie = {}
+        for key in index:
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[_END] = {}
+        self._prefix_re = re.compile(self._render(trie))
+
+        # every known key -> (input index, known key) for all known keys that prefix it, itself included
+        self._chains = {
+            key: tuple((index[prefix], prefix) for prefix in index if key.startswith(prefix))
+            for key in index
+        }
+
+    @classmethod
+    def _render(cls, node):
+        branches = [re.escape(char) + cls._render(child) for char, child in node.items() if char != _END]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # a known key ending here makes the rest optional, greedy so the longest key wins
+        return '(?:' + pattern + ')?' if _END in node else pattern
+
+    def _prefixes(self, key):
+        """(input index or None, known key) for every known key that prefixes `key`."""
+        chain = self._chains.get(key)
+        if chain is not None:
+            return chain
+
+        match = self._prefix_re.match(key)
+        if not match or not match.group(0) in self._chains:
+            return ()
+
+        return self._chains[match.group(0)]
+
+    def is_valid_key(self, key):
+        return key in self.exact_keys or bool(self._prefixes(key))
+
+    def is_list_type(self, key):
+        return key in self.list_types
+
+    def section_for(self, key):
+        owner = self._owner(key, ())
+        return self.key_to_section[self.inputs[owner]] if owner is not None else None
+
+    def _owner(self, key, item):
+        # an input claims a key when it is the key itself, or when it is a
+        # prefix of the key and not present in the item as an exact key
+        owner = None
+        for idx, prefix in self._prefixes(key):
+            if idx is None:
+                continue
+            if prefix == key or prefix not in item:
+                if owner is None or idx < owner:
+                    owner = idx
+
+        return owner
+
+    def group_attributes(self, item):
+        """
+        Pop every attribute of `item` that belongs to a section input and return
+        them as (key, section, value) tuples, ordered like SECTION_LIST.
+        Attributes claimed by no input are left in `item`.
+        """
+        matched = []
+        for order, key in enumerate(item):
+            owner = self._owner(key, item)
+            if owner is not None:
+                matched.append((owner, order, key))
+
+        matched.sort()
+
+        return [
+            (key, self.key_to_section[self.inputs[owner]], item.pop(key))
+            for owner, _, key in matched
+        ]
+
+
+FORM_SCHEMA = FormSchema(SECTION_LIST, BASE_KEYS, LIST_TYPES)
@@ -1,26 +1,34 @@
 import base64
 import datetime
+import json
+import time
 
-import stripe
-import requests
-
-from requests.auth import HTTPBasicAuth
 from typing import Dict
 from typing import Optional
 from mangum import Mangum
 from fastapi import APIRouter, FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from boto3.dynamodb.conditions import Key
 
-from config import API_V1_STR, PROJECT_NAME, SECTION_LIST
+from config import API_V1_STR, PROJECT_NAME
 from auth import get_email
+from log_utils import end_request, get_correlation_id, get_logger, start_request
+import metrics
+from form_schema import FORM_SCHEMA
 from utils import *
 from medicaid_detail_utils import *
+from docusign import get_envelope_recipients
+from payment_queue import get_payment_queue
+from secrets_provider import get_checkout_session_webhook_secret
+from stream_upload import FileTooLargeError, upload_base64
+from pagination import InvalidCursor, InvalidPageSize, fetch_page, parse_page_size
 from response_helpers import (
     response_headers, missing_file_contents, missing_file_name,
     invalid_token, forbidden_action, options_response, missing_files, 
     invalid_signature, unknown_event_type, invalid_request,
-    max_file_size_exceeded, invalid_checkout_session, incorrect_price
+    max_file_size_exceeded, invalid_checkout_session, incorrect_price,
+    uploaded_file_not_found, payment_enqueue_failed, payment_processing_failed,
+    invalid_cursor,
+    invalid_page_size
 )
 
 
@@ -33,14 +41,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-router = APIRouter()
+logger = get_logger(__name__)
+
+
+@app.middleware('http')
+async def correlation_id_middleware(request: Request, call_next):
+    # the caller's id when it sends one, otherwise the lambda request id
+    correlation_id = request.headers.get('x-correlation-id')
+    if not correlation_id:
+        # handler_local.py and other local callers pass a plain dict as the context
+        correlation_id = getattr(request.scope.get('aws.context'), 'aws_request_id', None)
+
+    token = start_request(correlation_id)
+    try:
+        response = await call_next(request)
+        response.headers['x-correlation-id'] = get_correlation_id()
+    finally:
+        end_request(token)
+
+    return response
+
+
+def _route_path(scope):
+    """Path of the route that handled the request, e.g. /api/get-files, None when no route matched."""
+    route = scope.get('route')
+    if route is not None:
+        # fastapi releases that mount included routers give their paths without the prefix
+        return route.path if route.path.startswith(API_V1_STR) else API_V1_STR + route.path
 
+    # older releases only leave the endpoint function in the scope
+    return _route_paths.get(scope.get('endpoint'))
 
-try:
-    kms = boto3.client('kms')
-    stripe.api_key = kms.decrypt(CiphertextBlob=base64.b64decode(os.getenv('STRIPE_API_KEY')))['Plaintext'].decode()
-except Exception as err:
-    stripe.api_key = os.getenv('STRIPE_API_KEY')
+
+@app.middleware('http')
+async def metrics_middleware(request: Request, call_next):
+    start = time.perf_counter()
+    token = metrics.start_request(metrics.UNMATCHED_ENDPOINT)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        # the route is only known once routing is done
+        endpoint = _route_path(request.scope) or metrics.UNMATCHED_ENDPOINT
+        metrics.end_request(token, (time.perf_counter() - start) * 1000, status_code, endpoint)
+
+    return response
+
+
+router = APIRouter()
 
 
 @router.post('/get-applications')
@@ -49,8 +98,22 @@ def get_applications(event_body: Dict):
     if not user_email:
         return invalid_token
 
+    if event_body.get('summary'):
+        try:
+            paginated = 'page_size' in event_body or 'cursor' in event_body
+            return get_application_summaries(
+                user_email,
+                event_body.get('cursor'),
+                limit=parse_page_size(event_body.get('page_size')) if paginated else None
+            )
+        except InvalidCursor:
+            return invalid_cursor
+        except InvalidPageSize:
+            return invalid_page_size
+
     response = table.query(
-        KeyConditionExpression=Key('email').eq(user_email)
+        KeyConditionExpression='email = :email',
+        ExpressionAttributeValues={':email': user_email}
     )
 
     resp = [eliminate_sensitive_info(ii) for ii in response['Items']]
@@ -80,21 +143,13 @@ def update_user_info(event_body: Dict):
     key_to_update = event_body['key_to_update']
     value_to_update = event_body['value_to_update']
 
-    val_from_db = get_db_value(user_email, key_to_update, application_uuid)
-
     now = datetime.datetime.now().isoformat()
-    user_info = UserInfo(updated_date=now, value=value_to_update)
+    user_info = UserInfo(updated_date=now, value=value_to_update, created_date=now)
 
-    if val_from_db and 'created_date' in val_from_db:
-        user_info.created_date = val_from_db['created_date']
-    else:
-        user_info.created_date = now
+    resp = upsert_detail(user_email, application_uuid, key_to_update, user_info.__dict__, preserve=('created_date',))
+    logger.debug('Update dynamodb result', response_metadata=resp['ResponseMetadata'])
 
-    resp = update_dynamodb(user_email, application_uuid, key_to_update, user_info.__dict__)
-    print ('Update dynamodb result:', resp)
-    resp = get_details(user_email, application_uuid)
-
-    return resp
+    return item_response(resp)
 
 
 @router.post('/update-details')
@@ -106,19 +161,49 @@ def update_details(event_body: Dict):
     key_to_update = event_body['key_to_update']
     value_to_update = event_body['value_to_update']
 
-    val_from_db = get_db_value(user_email, key_to_update, application_uuid)
-    value_to_update_medicaid_detail_format = None
-
     if is_list_type(key_to_update):
+        val_from_db = get_db_values(user_email, application_uuid, [key_to_update]).get(key_to_update)
         value_to_update_medicaid_detail_format = convert_to_medicaid_details_list(key_to_update, value_to_update, val_from_db)
+        resp = update_dynamodb(user_email, application_uuid, key_to_update, value_to_update_medicaid_detail_format, return_values='ALL_NEW')
     else:
-        value_to_update_medicaid_detail_format = convert_to_medicaid_detail(key_to_update, value_to_update, val_from_db)
+        value_to_update_medicaid_detail_format = convert_to_medicaid_detail(key_to_update, value_to_update, None)
+        resp = upsert_detail(user_email, application_uuid, key_to_update, value_to_update_medicaid_detail_format)
 
-    resp = update_dynamodb(user_email, application_uuid, key_to_update, value_to_update_medicaid_detail_format)
-    print ('Update dynamodb result:', resp)
-    resp = get_details(user_email, application_uuid)
+    logger.debug('Update dynamodb result', response_metadata=resp['ResponseMetadata'])
 
-    return resp
+    return item_response(resp)
+
+
+@router.post('/update-details-batch')
+def update_details_batch(event_body: Dict):
+    user_email = get_email(event_body)
+    if not user_email:
+        return invalid_token
+    application_uuid = event_body['application_uuid']
+
+    # later entries for the same key win, like consecutive /update-details calls
+    values_to_update = {}
+    for update in event_body.get('updates') or []:
+        values_to_update.pop(update['key_to_update'], None)
+        values_to_update[update['key_to_update']] = update['value_to_update']
+
+    if not values_to_update or len(values_to_update) > MAX_BATCH_UPDATE_KEYS:
+        return invalid_request
+
+    vals_from_db = get_db_values(user_email, application_uuid, list(values_to_update))
+
+    updates = {}
+    for key_to_update, value_to_update in values_to_update.items():
+        val_from_db = vals_from_db.get(key_to_update)
+        if is_list_type(key_to_update):
+            updates[key_to_update] = convert_to_medicaid_details_list(key_to_update, value_to_update, val_from_db)
+        else:
+            updates[key_to_update] = convert_to_medicaid_detail(key_to_update, value_to_update, val_from_db)
+
+    resp = update_dynamodb_batch(user_email, application_uuid, updates)
+    logger.debug('Update dynamodb result', response_metadata=resp['ResponseMetadata'])
+
+    return item_response(resp)
 
 
 @router.post('/upload-file')
@@ -135,13 +220,9 @@ def upload_file(event_body: Dict):
     if not files:
         return missing_files
 
-    documents = get_db_value(user_email, 'documents', application_uuid) or []
-
     for file in files:
-        file_name = file['file_name']
         file_contents = file['file_contents']
-        tags = file.get('tags', [])
-        if not file_name:
+        if not file['file_name']:
             return missing_file_name
 
         if not file_contents or file_contents == 'data:':
@@ -150,27 +231,145 @@ def upload_file(event_body: Dict):
         if get_file_size(file_contents) > MAX_FILE_SIZE:
             return max_file_size_exceeded
 
-        # remove base64 prefix for correct upload to s3.
-        idx = file_contents.find(';base64,')
-        file_contents = file_contents[idx+8:]
-        full_file_name = f'{user_email}/{application_uuid}/{document_type}/{file_name}'
+    def _upload(file):
+        file_name = file['file_name']
+        file_contents = file['file_contents']
+        try:
+            # skip the base64 prefix for correct upload to s3.
+            idx = file_contents.find(';base64,')
+            full_file_name = get_file_key(user_email, application_uuid, document_type, file_name)
+
+            upload_base64(s3.meta.client, BUCKET_NAME, full_file_name, file_contents,
+                          start=idx+8, max_bytes=MAX_FILE_SIZE_BYTES)
+        except FileTooLargeError:
+            return None, {'file_name': file_name, 'error': 'max file size limit exceeded'}
+        except Exception:
+            # the details stay in the logs, s3 errors aren't for the client
+            logger.exception('Error uploading file', file_name=file_name)
+            return None, {'file_name': file_name, 'error': 'upload failed'}
+
+        file_info = FileInfo(s3_location=get_s3_location(full_file_name),
+                             document_name=file_name,
+                             document_type=document_type,
+                             associated_medicaid_detail_uuid=associated_medicaid_detail_uuid,
+                             the_uuid=create_uuid(),
+                             tags=file.get('tags', [])
+                             )
+
+        return file_info.__dict__, None
+
+    documents = []
+    failed_files = []
+    for document, failure in thread_map(_upload, files, UPLOAD_CONCURRENCY):
+        if document:
+            documents.append(document)
+        else:
+            failed_files.append(failure)
+
+    if documents:
+        resp = append_documents(user_email, application_uuid, documents)
+        logger.debug('Update dynamodb result', response_metadata=resp['ResponseMetadata'])
+        resp = item_response(resp)
+    else:
+        resp = get_details(user_email, application_uuid)
+
+    resp['FailedFiles'] = failed_files
+
+    return resp
+
+
+@router.post('/create-upload-urls')
+def create_upload_urls(event_body: Dict):
+    user_email = get_email(event_body)
+    if not user_email:
+        return invalid_token
+    application_uuid = event_body['application_uuid']
+    document_type = event_body['document_type']
+    files = event_body['files']
+
+    if not files:
+        return missing_files
 
-        s3.Object(BUCKET_NAME, full_file_name).put(Body=base64.b64decode(file_contents))
-        s3_location = f'https://{BUCKET_NAME}.s3.amazonaws.com/{full_file_name}'
+    for file in files:
+        if not file.get('file_name'):
+            return missing_file_name
+
+        file_size = file.get('file_size')
+        if file_size is None:
+            continue
 
-        file_info = FileInfo(s3_location=s3_location,
+        if isinstance(file_size, bool) or not isinstance(file_size, int) or file_size < 0:
+            return invalid_request
+
+        if file_size > MAX_FILE_SIZE_BYTES:
+            return max_file_size_exceeded
+
+    resp = []
+    for file in files:
+        full_file_name = get_file_key(user_email, application_uuid, document_type, file['file_name'])
+        method = 'POST' if file.get('file_size') is None else 'PUT'
+        upload = create_upload_url(full_file_name, file.get('content_type') or 'application/octet-stream', method)
+        upload['file_name'] = file['file_name']
+        resp.append(upload)
+
+    return resp
+
+
+@router.post('/finalize-upload')
+def finalize_upload(event_body: Dict):
+    user_email = get_email(event_body)
+    if not user_email:
+        return invalid_token
+    application_uuid = event_body['application_uuid']
+    associated_medicaid_detail_uuid = event_body['associated_medicaid_detail_uuid']
+    document_type = event_body['document_type']
+    files = event_body['files']
+
+    if not files:
+        return missing_files
+
+    for file in files:
+        if not file['file_name']:
+            return missing_file_name
+
+    # files that did upload are recorded even when others didn't, so they
+    # aren't left in s3 without a document pointing at them
+    documents = []
+    failed_files = []
+    failure_response = None
+    for file in files:
+        file_name = file['file_name']
+        full_file_name = get_file_key(user_email, application_uuid, document_type, file_name)
+        file_size = get_uploaded_file_size(full_file_name)
+        if file_size is None:
+            failed_files.append({'file_name': file_name, 'error': 'uploaded file not found'})
+            failure_response = failure_response or uploaded_file_not_found
+            continue
+
+        if file_size > MAX_FILE_SIZE_BYTES:
+            s3.meta.client.delete_object(Bucket=BUCKET_NAME, Key=full_file_name)
+            failed_files.append({'file_name': file_name, 'error': 'max file size limit exceeded'})
+            failure_response = failure_response or max_file_size_exceeded
+            continue
+
+        file_info = FileInfo(s3_location=get_s3_location(full_file_name),
                              document_name=file_name,
                              document_type=document_type,
                              associated_medicaid_detail_uuid=associated_medicaid_detail_uuid,
                              the_uuid=create_uuid(),
-                             tags=tags
+                             tags=file.get('tags', [])
                              )
 
         documents.append(file_info.__dict__)
 
-    resp = update_dynamodb(user_email, application_uuid, 'documents', documents)
-    print ('Update dynamodb result:', resp)
-    resp = get_details(user_email, application_uuid)
+    if not documents:
+        return failure_response
+
+    resp = append_documents(user_email, application_uuid, documents)
+    logger.debug('Update dynamodb result', response_metadata=resp['ResponseMetadata'])
+
+    resp = item_response(resp)
+    resp['FailedFiles'] = failed_files
 
     return resp
 
@@ -192,37 +391,36 @@ def create_payment_session(event_body: Dict):
 
     verified_price = get_price_detail(user_email)
     if verified_price['price_id'] != event_body['price_id']:
-        print('Error verifying price')
+        logger.warning('Error verifying price', price_id=event_body['price_id'])
         return incorrect_price
 
     react_app_url = os.getenv('REACT_APP_URL')
+    stripe = get_stripe()
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price': verified_price['price_id'],
-                'quantity': 1
-            }],
-            mode='payment',
-            client_reference_id= event_body['application_uuid'],
-            success_url=f'{react_app_url}/success?sessionId={{CHECKOUT_SESSION_ID}}',
-            cancel_url=f'{react_app_url}/intake',
-            customer_email=user_email
-        )
+        with metrics.timed('stripe'):
+            session = stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=[{
+                    'price': verified_price['price_id'],
+                    'quantity': 1
+                }],
+                mode='payment',
+                client_reference_id= event_body['application_uuid'],
+                success_url=f'{react_app_url}/success?sessionId={{CHECKOUT_SESSION_ID}}',
+                cancel_url=f'{react_app_url}/intake',
+                customer_email=user_email
+            )
 
         return session.id
-    except stripe.error.InvalidRequestError as e: 
-        print('Error creating checkout session:' + str(e))
+    except stripe.error.InvalidRequestError:
+        logger.exception('Error creating checkout session')
         return invalid_checkout_session
 
 
 @router.post('/completed-checkout-session')
 def completed_checkout_session(request: Request):
-    try:
-        endpoint_secret = kms.decrypt(CiphertextBlob=base64.b64decode(os.getenv('CHECKOUT_SESSION_WEBHOOK_SECRET')),
-        EncryptionContext={'LambdaFunctionName': os.environ['AWS_LAMBDA_FUNCTION_NAME']})['Plaintext'].decode()
-    except Exception as e:
-        endpoint_secret = os.getenv('CHECKOUT_SESSION_WEBHOOK_SECRET')
+    stripe = get_stripe()
+    endpoint_secret = get_checkout_session_webhook_secret()
     try:
         event_body = request.scope['aws.event']['body']
         stripe_signature = request.scope['aws.event']['headers']['Stripe-Signature']
@@ -233,15 +431,29 @@ def completed_checkout_session(request: Request):
             event_body, stripe_signature, endpoint_secret
         )
     except stripe.error.SignatureVerificationError:
-        print('Error: invalid stripe signature')
+        logger.warning('Invalid stripe signature')
         return invalid_signature
 
     if event.type == 'checkout.session.completed':
-        try:
-            checkout_session = event.data.object
-            handle_successful_payment(checkout_session)
-        except Exception as e:
-            print('Error handling successful checkout session:', e)
+        # payment_worker finishes the payment, a failed enqueue makes stripe redeliver
+        queue = get_payment_queue()
+        if queue is None:
+            # no queue deployed for this lambda: finish the payment here, as before the worker
+            try:
+                handle_successful_payment(json.loads(event_body)['data']['object'])
+            except Exception:
+                logger.exception('Error finishing checkout session', event_id=event.id)
+                return payment_processing_failed()
+        else:
+            try:
+                message = json.loads(event_body)
+                # events of one application stay in order, the others don't wait on them
+                queue.send(
+                    message, deduplication_id=event.id, group_id=message['data']['object'].get('client_reference_id')
+                )
+            except Exception:
+                logger.exception('Error queuing checkout session', event_id=event.id)
+                return payment_enqueue_failed()
     else:
         return unknown_event_type
 
@@ -259,22 +471,28 @@ def get_files(event_body: Dict):
     application_uuid = event_body['application_uuid']
     uuid = event_body['uuid']
 
-    documents = get_details(user_email, application_uuid)['Item']['documents']
-    resp = []
-    for doc in documents:
-        if doc['associated_medicaid_detail_uuid'] != uuid:
-            continue
+    # 'url' returns short lived presigned urls, 'inline' the base64 file contents
+    mode = event_body.get('mode', 'inline')
+
+    documents = get_db_values(user_email, application_uuid, ['documents']).get('documents', [])
+    documents = [doc for doc in documents if doc['associated_medicaid_detail_uuid'] == uuid]
 
+    def _get_file(doc):
         file_name = doc['document_name']
-        full_file_name = f'{user_email}/{application_uuid}/{doc["document_type"]}/{file_name}'
-        image = s3.Object(BUCKET_NAME, full_file_name).get()['Body'].read()
+        full_file_name = get_file_key(user_email, application_uuid, doc['document_type'], file_name)
 
-        item = {
+        if mode == 'url':
+            return {
+                'document_name': file_name,
+                'url': get_download_url(full_file_name)
+            }
+
+        return {
             'document_name': file_name,
-            'image': base64.b64encode(image)
+            'image': base64.b64encode(get_file_contents(full_file_name))
         }
 
-        resp.append(item)
+    resp = thread_map(_get_file, documents, DOWNLOAD_CONCURRENCY)
 
     return resp
 
@@ -287,39 +505,11 @@ def check_signed(event_body: Dict):
     if not user_email:
         return invalid_token
 
-    # get access token
-    ds_client_id = os.getenv("DS_CLIENT_ID")
-    ds_client_secret = os.getenv("DS_CLIENT_SECRET")
-    refresh_token = os.getenv("DS_REFRESH_TOKEN")
-
-    data = {
-        'grant_type': 'refresh_token',
-        'refresh_token': refresh_token
-    }
-
-    auth_url = 'https://account-d.docusign.com/oauth/token'
-
-    resp = requests.post(auth_url, data=data, auth=HTTPBasicAuth(ds_client_id, ds_client_secret)).json()
-
-    access_token = resp['access_token']
-    print ('ds access token:', access_token)
-
-    headers = {
-        'Authorization': f'Bearer {access_token}'
-    }
-
-    account_id = os.getenv('DS_ACCOUNT_ID')
     body = event_body['value_to_update']
     envelope_id = body['envelope']
     recipient_id = body['recipient']
 
-    # get recipients
-    params = {
-        'include': 'recipients'
-    }
-    base_url = os.getenv('DS_BASE_URL')
-    url = base_url + f'/restapi/v2.1/accounts/{account_id}/envelopes/{envelope_id}/recipients'
-    resp = requests.get(url, headers=headers, params=params).json()
+    resp = get_envelope_recipients(envelope_id)
 
     status = ''
     for ii in resp['signers']:
@@ -352,15 +542,22 @@ def get_users(event_body: Dict, order_by: str, page: int, page_size: int, q: Opt
         return forbidden_action
 
     q = q.lower()
-    resp = table.scan()
+    summaries = parallel_scan(
+        portal_summary_table,
+        ProjectionExpression='email, application_uuid, submitted_date, first_name, last_name, state_of_service, #status',
+        ExpressionAttributeNames={'#status': 'status'}
+    )
     items = []
 
-    for ii in resp['Items']:
+    for ii in summaries:
         item = {
             'email': ii['email'],
+            'application_uuid': ii['application_uuid'],
             'submitted_date': ii.get('submitted_date', ''),
-            'first_name': ii['applicant_info.first_name']['value'] if 'applicant_info.first_name' in ii else '',
-            'last_name': ii['applicant_info.last_name']['value'] if 'applicant_info.last_name' in ii else ''
+            'first_name': ii.get('first_name', ''),
+            'last_name': ii.get('last_name', ''),
+            'state_of_service': ii.get('state_of_service', ''),
+            'status': ii.get('status', '')
         }
 
         if any([q in item['email'].lower(), q in item['first_name'].lower(), q in item['last_name'].lower()]):
@@ -389,15 +586,12 @@ def get_user(event_body: Dict):
 
     email = event_body['email']
     response = table.query(
-        KeyConditionExpression=Key('email').eq(email)
+        KeyConditionExpression='email = :email',
+        ExpressionAttributeValues={':email': email}
     )
 
     item = response['Items'][0]
 
-    inputs = []
-    for _inputs in SECTION_LIST:
-        inputs += _inputs['inputs']
-
     result = {
         'email': item.pop('email'),
         'submitted_date': item.pop('submitted_date') if 'submitted_date' in item else '',
@@ -418,22 +612,14 @@ def get_user(event_body: Dict):
     for ii in excludes:
         item.pop(ii, None)
 
-    for key in inputs:
-        if key in item:
-            result['items'].append({
-                'key': key,
-                'val': item.pop(key)
-            })
-        else:
-            _item = dict(item)
-            for _key in _item:
-                if _key.startswith(key):
-                    result['items'].append({
-                        'key': _key,
-                        'val': item.pop(_key)
-                    })
+    for key, section, val in FORM_SCHEMA.group_attributes(item):
+        result['items'].append({
+            'key': key,
+            'section': section,
+            'val': val
+        })
 
-    print (item, '*'*10)
+    logger.debug('Attributes left out of the user summary', attributes=sorted(item))
 
     return result
 
@@ -447,7 +633,18 @@ def get_custom_prices(event_body: Dict):
     if not user_email:
         return invalid_token
 
-    resp = custom_price_table.scan()
+    try:
+        resp = fetch_page(
+            custom_price_table.scan,
+            event_body.get('cursor'),
+            limit=parse_page_size(event_body.get('page_size')),
+            ProjectionExpression=CUSTOM_PRICE_PROJECTION,
+            ExpressionAttributeNames=CUSTOM_PRICE_ATTRIBUTE_NAMES
+        )
+    except InvalidCursor:
+        return invalid_cursor
+    except InvalidPageSize:
+        return invalid_page_size
 
     return resp
 
@@ -481,6 +678,7 @@ def create_custom_price(event_body: Dict):
         },
         ReturnValues='NONE'
     )
+    invalidate_price_cache(email)
 
     resp = get_price_detail(email)
 
@@ -497,13 +695,35 @@ def update_custom_price(event_body: Dict):
     price = event_body['price']
     now = datetime.datetime.now().isoformat()
 
-    update_custom_price_dynamodb(email, 'price', price)
-    update_custom_price_dynamodb(email, 'updated_at', now)
-    update_custom_price_dynamodb(email, 'updated_by', user_email)
+    resp = update_custom_price_dynamodb(email, {
+        'price': price,
+        'updated_at': now,
+        'updated_by': user_email
+    }, return_values='ALL_NEW')
+    invalidate_price_cache(email)
 
-    resp = get_price_detail(email)
+    return resp['Attributes']
 
-    return resp
+
+@router.post('/import-custom-prices')
+def bulk_import_custom_prices(event_body: Dict):
+    user_email = get_email(event_body)
+    if not user_email:
+        return invalid_token
+
+    internal_users = os.getenv('INTERNAL_USERS', '').split(',')
+    if user_email not in internal_users:
+        return forbidden_action
+
+    prices = parse_custom_prices(event_body)
+    if not prices or len(prices) > MAX_CUSTOM_PRICE_IMPORT_ROWS:
+        return invalid_request
+
+    import_custom_prices(prices, user_email)
+
+    return {
+        'Count': len(prices)
+    }
 
 
 @router.post('/delete-custom-price')
@@ -516,9 +736,11 @@ def delete_custom_price(event_body: Dict):
     resp = custom_price_table.delete_item(
         Key={'email': email}
     )
+    invalidate_price_cache(email)
 
     return resp
 
 
 app.include_router(router, prefix=API_V1_STR)
+_route_paths = {route.endpoint: API_V1_STR + route.path for route in router.routes}
 handler = Mangum(app)
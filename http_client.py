@@ -0,0 +1,71 @@
+import os
+import threading
+
+from urllib.parse import urlsplit
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import timed
+
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.3))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _build_session():
+    # connection errors are retried for every method, error statuses only for
+    # the idempotent ones urllib3 allows by default (so never for POST)
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_session(url):
+    """Keep-alive session for the host of `url`, shared by the whole container."""
+    parts = urlsplit(url)
+    origin = f'{parts.scheme}://{parts.netloc}'
+
+    session = _sessions.get(origin)
+    if session is None:
+        with _lock:
+            session = _sessions.get(origin)
+            if session is None:
+                session = _build_session()
+                _sessions[origin] = session
+
+    return session
+
+
+def request(method, url, dependency=None, **kwargs):
+    """`dependency` names the service in latency metrics, it defaults to the host of `url`."""
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+    with timed(dependency or urlsplit(url).hostname):
+        return get_session(url).request(method, url, **kwargs)
+
+
+def get(url, dependency=None, **kwargs):
+    return request('GET', url, dependency=dependency, **kwargs)
+
+
+def post(url, dependency=None, **kwargs):
+    return request('POST', url, dependency=dependency, **kwargs)
@@ -1,24 +1,31 @@
-import requests
+import os
+import threading
+import time
+
+import http_client
 
 from jose import jwt, jwk
 from jose.utils import base64url_decode
 
+from log_utils import get_logger
+
+
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 3600))
+# minimum seconds between two forced refreshes triggered by an unknown kid
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+
+logger = get_logger(__name__)
 
-def get_hmac_key(token: str, jwks):
-    kid = jwt.get_unverified_header(token).get("kid")
-    for key in jwks.get("keys", []):
-        if key.get("kid") == kid:
-            return key
 
+def verify_jwt(token: str, jwks, header=None) -> bool:
+    if header is None:
+        header = jwt.get_unverified_header(token)
 
-def verify_jwt(token: str, jwks) -> bool:
-    hmac_key = get_hmac_key(token, jwks)
+    hmac_key = verifier_registry.get(header.get("kid"), jwks)
 
     if not hmac_key:
         raise ValueError("No pubic key found!")
 
-    hmac_key = jwk.construct(get_hmac_key(token, jwks))
-
     message, encoded_signature = token.rsplit(".", 1)
 
     decoded_signature = base64url_decode(encoded_signature.encode())
@@ -27,8 +34,116 @@ def verify_jwt(token: str, jwks) -> bool:
 
 
 def get_jwks(jwks_url):
-    resp = requests.get(
-        jwks_url
+    resp = http_client.get(
+        jwks_url, dependency='jwks'
     ).json()
 
     return resp
+
+
+class JwksCache:
+    """
+    Keeps the JWKS document of a single url in the warm container.
+
+    A fresh copy is served straight from memory. Once the ttl has passed the
+    stale copy is still served while a background thread fetches a new one.
+    A token signed with a kid we don't know forces a synchronous refresh, and
+    a failed fetch always falls back to whatever copy we already have.
+    """
+
+    def __init__(self, jwks_url, ttl=JWKS_CACHE_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.jwks = None
+        self.fetched_at = 0
+        self._last_attempt = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self, kid=None):
+        jwks = self.jwks
+
+        if jwks is None:
+            return self.refresh()
+
+        if kid is not None and not self._has_kid(jwks, kid):
+            if time.time() - self._last_attempt >= self.min_refresh_interval:
+                return self.refresh()
+            return jwks
+
+        if time.time() - self.fetched_at >= self.ttl:
+            self._refresh_in_background()
+
+        return jwks
+
+    def refresh(self):
+        with self._lock:
+            self._last_attempt = time.time()
+            try:
+                jwks = get_jwks(self.jwks_url)
+                if 'keys' not in jwks:
+                    raise ValueError('JWKS document without keys')
+            except Exception:
+                if self.jwks is None:
+                    raise
+                logger.exception('Error refreshing JWKS, using stale copy')
+                return self.jwks
+
+            self.jwks = jwks
+            self.fetched_at = time.time()
+
+            return jwks
+
+    def _refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    @staticmethod
+    def _has_kid(jwks, kid):
+        return any(key.get('kid') == kid for key in jwks.get('keys', []))
+
+
+class VerifierRegistry:
+    """
+    Public key objects indexed by kid.
+
+    Keys are constructed lazily the first time a kid is seen and reused until
+    a different JWKS document is passed in, which happens when JwksCache
+    replaces its copy after a refresh.
+    """
+
+    def __init__(self):
+        self._jwks = None
+        self._jwks_by_kid = {}
+        self._verifiers = {}
+        self._lock = threading.Lock()
+
+    def get(self, kid, jwks):
+        with self._lock:
+            if jwks is not self._jwks:
+                self._jwks = jwks
+                self._jwks_by_kid = {key.get('kid'): key for key in jwks.get('keys', [])}
+                self._verifiers = {}
+
+            verifier = self._verifiers.get(kid)
+            if verifier is None:
+                key = self._jwks_by_kid.get(kid)
+                if not key:
+                    return None
+                verifier = jwk.construct(key)
+                self._verifiers[kid] = verifier
+
+            return verifier
+
+
+verifier_registry = VerifierRegistry()
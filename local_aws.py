@@ -0,0 +1,459 @@
+"""
+In-memory stand-ins for the DynamoDB tables, S3, KMS, SES and Stripe the
+handler talks to, so endpoints can be tested and benchmarked without AWS.
+
+`install()` puts them where aws_clients and utils look for the real ones,
+the `stand_ins` fixture of conftest.py does so for a single test.
+Every call first sleeps for the latency configured for its service, then
+reports that latency to `metrics` under the dependency name the real boto3
+client would use. Only the parts of the APIs this repo calls are covered.
+DynamoDB expressions are evaluated for the forms utils.py builds: SET with
+if_not_exists and list_append, nested `#a.#b` paths, attribute_(not_)exists
+and `name = :value` conditions.
+"""
+import copy
+import io
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+import metrics
+import utils
+
+
+# ms slept per call, set through install()
+LATENCY_MS = {
+    'dynamodb': 0,
+    's3': 0,
+    'kms': 0,
+    'ses': 0,
+    'stripe': 0
+}
+# partition and sort key of each table by the name of its lazy_table proxy,
+# tables not listed use KEY_SCHEMA_DEFAULT
+KEY_SCHEMA_DEFAULT = ('email', 'application_uuid')
+KEY_SCHEMAS = {
+    utils.custom_price_table._name: ('email',),
+    utils.stripe_price_table._name: ('price_id',),
+}
+_MISSING = object()
+
+
+def _call(service, record=True):
+    latency = LATENCY_MS.get(service, 0) / 1000
+    if latency:
+        time.sleep(latency)
+    if record:
+        metrics.record(service, latency * 1000)
+
+
+def _response_metadata():
+    return {'RequestId': uuid.uuid4().hex, 'HTTPStatusCode': 200, 'RetryAttempts': 0}
+
+
+def _client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class ConditionalCheckFailedException(ClientError):
+    def __init__(self, operation='UpdateItem'):
+        super().__init__({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}}, operation)
+
+
+def _split_top_level(expr, separator=','):
+    """Split on `separator` outside of parentheses."""
+    parts = []
+    depth = 0
+    current = ''
+    for char in expr:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+
+    return parts
+
+
+def _path(expr, names):
+    return [names.get(part, part) for part in expr.strip().split('.')]
+
+
+def _get_path(item, path):
+    value = item
+    for part in path:
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+
+    return value
+
+
+def _set_path(item, path, value):
+    parent = _get_path(item, path[:-1]) if len(path) > 1 else item
+    if not isinstance(parent, dict):
+        raise _client_error('ValidationException', 'UpdateItem')
+    parent[path[-1]] = value
+
+
+def _evaluate(expr, item, names, values):
+    expr = expr.strip()
+    if expr.startswith(':'):
+        return copy.deepcopy(values[expr])
+
+    function = re.match(r'^(\w+)\((.*)\)$', expr)
+    if function is None:
+        return _get_path(item, _path(expr, names))
+
+    name, args = function.group(1), _split_top_level(function.group(2))
+    if name == 'if_not_exists':
+        current = _get_path(item, _path(args[0], names))
+        return _evaluate(args[1], item, names, values) if current is _MISSING else current
+    if name == 'list_append':
+        return list(_evaluate(args[0], item, names, values)) + list(_evaluate(args[1], item, names, values))
+
+    raise NotImplementedError(expr)
+
+
+def _matches(expr, item, names, values):
+    if not expr:
+        return True
+
+    for clause in re.split(r'\s+AND\s+', expr.strip(), flags=re.IGNORECASE):
+        function = re.match(r'^(attribute_exists|attribute_not_exists)\((.*)\)$', clause)
+        if function:
+            exists = _get_path(item, _path(function.group(2), names)) is not _MISSING
+            if exists != (function.group(1) == 'attribute_exists'):
+                return False
+            continue
+
+        left, right = clause.split('=')
+        if _evaluate(left, item, names, values) != _evaluate(right, item, names, values):
+            return False
+
+    return True
+
+
+def _project(item, projection, names):
+    # only top level attributes are ever projected here
+    if not projection:
+        return copy.deepcopy(item)
+
+    attributes = (names.get(expr, expr) for expr in _split_top_level(projection))
+
+    return {attr: copy.deepcopy(item[attr]) for attr in attributes if attr in item}
+
+
+class _BatchWriter:
+    def __init__(self, table):
+        self.table = table
+        self.pending = []
+
+    def put_item(self, Item):
+        self.pending.append(Item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # BatchWriteItem takes 25 items per call
+        for start in range(0, len(self.pending), 25):
+            _call('dynamodb')
+            for item in self.pending[start:start + 25]:
+                self.table._put(item)
+
+
+class FakeTable:
+    def __init__(self, client, name):
+        self.name = name
+        self.key_schema = KEY_SCHEMAS.get(f'table:{name}', KEY_SCHEMA_DEFAULT)
+        self.meta = type('Meta', (), {'client': client})()
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def _key(self, item):
+        return tuple(item[attr] for attr in self.key_schema)
+
+    def _put(self, item):
+        with self._lock:
+            self._items[self._key(item)] = copy.deepcopy(item)
+
+    def put_item(self, Item, **kwargs):
+        _call('dynamodb')
+        self._put(Item)
+
+        return {'ResponseMetadata': _response_metadata()}
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        _call('dynamodb')
+        resp = {'ResponseMetadata': _response_metadata()}
+        with self._lock:
+            item = self._items.get(self._key(Key))
+            if item is not None:
+                resp['Item'] = _project(item, ProjectionExpression, ExpressionAttributeNames or {})
+
+        return resp
+
+    def delete_item(self, Key, **kwargs):
+        _call('dynamodb')
+        with self._lock:
+            self._items.pop(self._key(Key), None)
+
+        return {'ResponseMetadata': _response_metadata()}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ConditionExpression=None, ReturnValues='NONE', **kwargs):
+        _call('dynamodb')
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self._lock:
+            existing = self._items.get(self._key(Key))
+            # conditions see a missing item as empty, key attributes included
+            if not _matches(ConditionExpression, existing or {}, names, values):
+                raise ConditionalCheckFailedException()
+            old = existing or copy.deepcopy(Key)
+
+            # every right hand side sees the item as it was before the update
+            assert UpdateExpression.startswith('SET ')
+            assignments = []
+            for clause in _split_top_level(UpdateExpression[4:]):
+                target, expr = clause.split('=', 1)
+                assignments.append((_path(target, names), _evaluate(expr, old, names, values)))
+
+            new = copy.deepcopy(old)
+            for path, value in assignments:
+                _set_path(new, path, value)
+            self._items[self._key(Key)] = new
+
+            resp = {'ResponseMetadata': _response_metadata()}
+            if ReturnValues == 'ALL_NEW':
+                resp['Attributes'] = copy.deepcopy(new)
+            elif ReturnValues == 'UPDATED_NEW':
+                # whole top level attributes, even when only a nested path was set
+                resp['Attributes'] = {path[0]: copy.deepcopy(new[path[0]]) for path, _ in assignments}
+
+        return resp
+
+    def _page(self, items, Limit=None, ExclusiveStartKey=None, ProjectionExpression=None,
+              ExpressionAttributeNames=None, ExpressionAttributeValues=None, FilterExpression=None):
+        names = ExpressionAttributeNames or {}
+        if ExclusiveStartKey:
+            start_key = self._key(ExclusiveStartKey)
+            items = [ii for ii in items if self._key(ii) > start_key]
+
+        evaluated = items[:Limit] if Limit else items
+        resp = {
+            'Items': [
+                _project(ii, ProjectionExpression, names) for ii in evaluated
+                if _matches(FilterExpression, ii, names, ExpressionAttributeValues or {})
+            ],
+            'ScannedCount': len(evaluated),
+            'ResponseMetadata': _response_metadata()
+        }
+        resp['Count'] = len(resp['Items'])
+        if Limit and len(items) > Limit:
+            resp['LastEvaluatedKey'] = {attr: evaluated[-1][attr] for attr in self.key_schema}
+
+        return resp
+
+    def _sorted_items(self):
+        with self._lock:
+            return [self._items[key] for key in sorted(self._items)]
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None, **kwargs):
+        _call('dynamodb')
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        items = [ii for ii in self._sorted_items() if _matches(KeyConditionExpression, ii, names, values)]
+
+        return self._page(items, ExpressionAttributeNames=names, ExpressionAttributeValues=values, **kwargs)
+
+    def scan(self, Segment=0, TotalSegments=1, ConsistentRead=None, ReturnConsumedCapacity=None, **kwargs):
+        _call('dynamodb')
+        items = [ii for ii in self._sorted_items() if hash(self._key(ii)) % TotalSegments == Segment]
+
+        return self._page(items, **kwargs)
+
+    def batch_writer(self, **kwargs):
+        return _BatchWriter(self)
+
+
+class FakeDynamoDBClient:
+    exceptions = type('Exceptions', (), {
+        'ConditionalCheckFailedException': ConditionalCheckFailedException,
+        'ClientError': ClientError
+    })
+
+    def __init__(self):
+        self.tables = {}
+
+    def scan(self, TableName, **kwargs):
+        return self.tables[TableName].scan(**kwargs)
+
+
+class FakeDynamoDB:
+    def __init__(self):
+        self.meta = type('Meta', (), {'client': FakeDynamoDBClient()})()
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        with self._lock:
+            tables = self.meta.client.tables
+            if name not in tables:
+                tables[name] = FakeTable(self.meta.client, name)
+
+            return tables[name]
+
+
+class FakeS3Client:
+    exceptions = type('Exceptions', (), {'ClientError': ClientError})
+
+    def __init__(self):
+        self.objects = {}
+        self._uploads = {}
+        self._ids = itertools.count()
+
+    def generate_presigned_post(self, Bucket, Key, **kwargs):
+        return {'url': f'https://{Bucket}.s3.amazonaws.com/', 'fields': {'key': Key}}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        return f'https://{Params["Bucket"]}.s3.amazonaws.com/{Params["Key"]}?X-Amz-Expires={ExpiresIn}'
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        _call('s3')
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+        return {'ETag': uuid.uuid4().hex}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        _call('s3')
+        if (Bucket, Key) not in self.objects:
+            raise _client_error('NoSuchKey', 'GetObject')
+
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        _call('s3')
+        if (Bucket, Key) not in self.objects:
+            raise _client_error('404', 'HeadObject')
+
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        _call('s3')
+        self.objects.pop((Bucket, Key), None)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        _call('s3')
+        upload_id = str(next(self._ids))
+        self._uploads[upload_id] = {}
+
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        _call('s3')
+        self._uploads[UploadId][PartNumber] = bytes(Body)
+
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        _call('s3')
+        parts = self._uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b''.join(parts[number] for number in sorted(parts))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        _call('s3')
+        self._uploads.pop(UploadId, None)
+
+
+class FakeS3:
+    def __init__(self):
+        self.meta = type('Meta', (), {'client': FakeS3Client()})()
+
+
+class FakeKMS:
+    def decrypt(self, CiphertextBlob, **kwargs):
+        _call('kms')
+
+        return {'Plaintext': CiphertextBlob}
+
+
+class FakeSES:
+    def send_raw_email(self, **kwargs):
+        _call('ses')
+
+        return {'MessageId': uuid.uuid4().hex}
+
+
+class _StripeObject(dict):
+    __getattr__ = dict.__getitem__
+
+
+class FakeStripe:
+    """
+    Module-like stand-in for `stripe`. Only sleeps, handler.py and utils.py
+    already time their stripe calls themselves.
+    """
+
+    class error:
+        class InvalidRequestError(Exception):
+            pass
+
+        class SignatureVerificationError(Exception):
+            pass
+
+    def __init__(self):
+        self.api_key = None
+
+        class Session:
+            @staticmethod
+            def create(**kwargs):
+                _call('stripe', record=False)
+                return _StripeObject(id=f'cs_test_{uuid.uuid4().hex}', **kwargs)
+
+        class PaymentIntent:
+            @staticmethod
+            def retrieve(payment_intent_id, **kwargs):
+                _call('stripe', record=False)
+                return _StripeObject(id=payment_intent_id, amount=9900, currency='usd', status='succeeded')
+
+        class Webhook:
+            @staticmethod
+            def construct_event(payload, signature, secret):
+                # signatures aren't checked, the event is the payload itself
+                return _StripeObject(json.loads(payload))
+
+        self.checkout = type('checkout', (), {'Session': Session})
+        self.PaymentIntent = PaymentIntent
+        self.Webhook = Webhook
+
+
+def install(latency_ms=None):
+    """Route every AWS and Stripe call of aws_clients and utils to fresh in-memory stand-ins."""
+    LATENCY_MS.update(latency_ms or {})
+
+    dynamodb = FakeDynamoDB()
+    aws_clients._instances.clear()
+    aws_clients._instances.update({
+        'dynamodb': dynamodb,
+        's3': FakeS3(),
+        'kms': FakeKMS(),
+        'ses': FakeSES()
+    })
+    utils._stripe = FakeStripe()
+    utils.invalidate_price_cache()
+    utils.download_url_cache.clear()
+
+    return dynamodb
@@ -0,0 +1,135 @@
+import contextvars
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import traceback
+import uuid
+
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), LEVELS['INFO'])
+# share of requests that also emit their debug logs when LOG_LEVEL is above DEBUG
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.01))
+# longest rendering of a single field, longer ones are cut off
+LOG_MAX_FIELD_CHARS = int(os.environ.get('LOG_MAX_FIELD_CHARS', 1024))
+
+_correlation_id = contextvars.ContextVar('correlation_id', default=None)
+_debug_sampled = contextvars.ContextVar('debug_sampled', default=False)
+_write_lock = threading.Lock()
+
+
+def start_request(correlation_id=None):
+    """
+    Tag every log line of the current request with `correlation_id` (a new
+    one when not given) and decide whether the request's debug logs are
+    sampled. Returns a token for `end_request`.
+    """
+    correlation_id = correlation_id or uuid.uuid4().hex
+    sampled = random.random() < LOG_DEBUG_SAMPLE_RATE
+
+    return _correlation_id.set(correlation_id), _debug_sampled.set(sampled)
+
+
+def end_request(token):
+    correlation_token, sampled_token = token
+    _debug_sampled.reset(sampled_token)
+    _correlation_id.reset(correlation_token)
+
+
+def get_correlation_id():
+    return _correlation_id.get()
+
+
+def render_field(value, max_chars=LOG_MAX_FIELD_CHARS):
+    """Json friendly `value`, or its serialization cut to `max_chars` when that is longer."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+
+    if isinstance(value, (dict, list)):
+        try:
+            rendered = json.dumps(value, default=str, separators=(',', ':'))
+        except (TypeError, ValueError):
+            rendered = repr(value)
+        if len(rendered) <= max_chars:
+            return value
+    else:
+        rendered = str(value)
+
+    if len(rendered) <= max_chars:
+        return rendered
+
+    return f'{rendered[:max_chars]}...<{len(rendered) - max_chars} more chars>'
+
+
+class JsonLogger:
+    """
+    Writes one json object per line to stdout, which Lambda ships to CloudWatch.
+
+    Fields are only rendered for lines that are actually written, so a debug
+    call with a large payload costs next to nothing while debug is off.
+    """
+
+    def __init__(self, name, stream=None):
+        self.name = name
+        self.stream = stream
+
+    def is_enabled_for(self, level):
+        level = LEVELS[level]
+        if level >= LOG_LEVEL:
+            return True
+
+        return level == LEVELS['DEBUG'] and _debug_sampled.get()
+
+    def log(self, level, message, **fields):
+        if not self.is_enabled_for(level):
+            return
+
+        record = {
+            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+            'level': level,
+            'logger': self.name,
+            'message': message
+        }
+        correlation_id = _correlation_id.get()
+        if correlation_id:
+            record['correlation_id'] = correlation_id
+        for key, value in fields.items():
+            record[key] = render_field(value)
+
+        line = json.dumps(record, default=str) + '\n'
+        stream = self.stream or sys.stdout
+        with _write_lock:
+            stream.write(line)
+            stream.flush()
+
+    def debug(self, message, **fields):
+        self.log('DEBUG', message, **fields)
+
+    def info(self, message, **fields):
+        self.log('INFO', message, **fields)
+
+    def warning(self, message, **fields):
+        self.log('WARNING', message, **fields)
+
+    def error(self, message, **fields):
+        self.log('ERROR', message, **fields)
+
+    def exception(self, message, **fields):
+        """Error line with the traceback of the exception being handled."""
+        fields.setdefault('error', str(sys.exc_info()[1]))
+        fields.setdefault('traceback', traceback.format_exc())
+        self.log('ERROR', message, **fields)
+
+
+_loggers = {}
+
+
+def get_logger(name):
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers.setdefault(name, JsonLogger(name))
+
+    return logger
@@ -0,0 +1,197 @@
+"""
+Request and downstream latency metrics.
+
+In lambda every request is written as CloudWatch Embedded Metric Format
+lines on stdout, which CloudWatch turns into metrics without any API calls.
+Elsewhere they go to the in-memory `collector` instead.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'MedicaidDetails')
+# 'emf' or 'memory', lambda defaults to emf and everything else to memory
+METRICS_BACKEND = os.environ.get(
+    'METRICS_BACKEND', 'emf' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'memory'
+)
+# endpoint dimension of calls made outside a request, e.g. during a cold start
+BACKGROUND_ENDPOINT = 'background'
+# endpoint dimension of requests no route matched, so unknown paths can't add dimension values
+UNMATCHED_ENDPOINT = 'unmatched'
+# EMF accepts at most 100 values per metric in one line
+_MAX_EMF_VALUES = 100
+
+_scope = contextvars.ContextVar('metrics_scope', default=None)
+_write_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """Latencies of one request, grouped by dependency. Shared with the threads the request fans out to."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.latencies = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, dependency, elapsed_ms):
+        with self._lock:
+            self.latencies[dependency].append(elapsed_ms)
+
+
+class MemoryCollector:
+    """Keeps every measurement in memory, for running locally and for benchmarks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.requests = defaultdict(list)
+            self.dependencies = defaultdict(list)
+            self.errors = defaultdict(int)
+
+    def record_request(self, endpoint, duration_ms, status_code, request_metrics):
+        with self._lock:
+            self.requests[endpoint].append(duration_ms)
+            if status_code >= 500:
+                self.errors[endpoint] += 1
+            for dependency, latencies in request_metrics.latencies.items():
+                self.dependencies[(endpoint, dependency)] += latencies
+
+    def record_dependency(self, endpoint, dependency, elapsed_ms):
+        with self._lock:
+            self.dependencies[(endpoint, dependency)].append(elapsed_ms)
+
+    def summary(self):
+        """{endpoint: {'count', 'errors', 'p50', 'p95', 'max', 'dependencies': {name: {...}}}} in milliseconds."""
+        with self._lock:
+            result = {}
+            for endpoint, durations in self.requests.items():
+                result[endpoint] = dict(_describe(durations), errors=self.errors[endpoint], dependencies={})
+            for (endpoint, dependency), latencies in self.dependencies.items():
+                entry = result.setdefault(endpoint, dict(_describe([]), errors=0, dependencies={}))
+                entry['dependencies'][dependency] = _describe(latencies)
+
+            return result
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _describe(values):
+    if not values:
+        return {'count': 0}
+
+    ordered = sorted(values)
+
+    return {
+        'count': len(ordered),
+        'p50': _percentile(ordered, 0.5),
+        'p95': _percentile(ordered, 0.95),
+        'max': ordered[-1]
+    }
+
+
+collector = MemoryCollector()
+
+
+def _emit(dimensions, metrics, values):
+    line = dict(values, _aws={
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [list(dimensions)],
+            'Metrics': [{'Name': name, 'Unit': unit} for name, unit in metrics]
+        }]
+    })
+    line.update(dimensions)
+
+    with _write_lock:
+        sys.stdout.write(json.dumps(line) + '\n')
+        sys.stdout.flush()
+
+
+def _emit_dependency(endpoint, dependency, latencies):
+    for start in range(0, len(latencies), _MAX_EMF_VALUES):
+        chunk = latencies[start:start + _MAX_EMF_VALUES]
+        _emit(
+            {'Endpoint': endpoint, 'Dependency': dependency},
+            [('Latency', 'Milliseconds'), ('Calls', 'Count')],
+            {'Latency': chunk, 'Calls': len(chunk)}
+        )
+
+
+def record(dependency, elapsed_ms):
+    """Latency of one call to `dependency`, attributed to the current request."""
+    scope = _scope.get()
+    if scope is not None:
+        scope.add(dependency, elapsed_ms)
+    elif METRICS_BACKEND == 'emf':
+        _emit_dependency(BACKGROUND_ENDPOINT, dependency, [elapsed_ms])
+    else:
+        collector.record_dependency(BACKGROUND_ENDPOINT, dependency, elapsed_ms)
+
+
+@contextmanager
+def timed(dependency):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(dependency, (time.perf_counter() - start) * 1000)
+
+
+def start_request(endpoint):
+    """Attribute the calls of the current request to `endpoint`, returns a token for `end_request`."""
+    request_metrics = RequestMetrics(endpoint)
+
+    return request_metrics, _scope.set(request_metrics)
+
+
+def end_request(token, duration_ms, status_code, endpoint=None):
+    """Report the request of `token`, under `endpoint` when it is only known by now."""
+    request_metrics, scope_token = token
+    _scope.reset(scope_token)
+    if endpoint is not None:
+        request_metrics.endpoint = endpoint
+
+    if METRICS_BACKEND != 'emf':
+        collector.record_request(request_metrics.endpoint, duration_ms, status_code, request_metrics)
+        return
+
+    _emit(
+        {'Endpoint': request_metrics.endpoint},
+        [('Duration', 'Milliseconds'), ('Errors', 'Count')],
+        {'Duration': duration_ms, 'Errors': int(status_code >= 500), 'StatusCode': status_code}
+    )
+    for dependency, latencies in request_metrics.latencies.items():
+        _emit_dependency(request_metrics.endpoint, dependency, latencies)
+
+
+def instrument_boto_client(client):
+    """Time every api call `client` makes, reported under its service name."""
+    service = client.meta.service_model.service_name
+
+    def _before_call(context, **kwargs):
+        context['metrics_start'] = time.perf_counter()
+
+    def _after_call(context, **kwargs):
+        start = context.pop('metrics_start', None)
+        if start is not None:
+            record(service, (time.perf_counter() - start) * 1000)
+
+    events = client.meta.events
+    events.register('before-call', _before_call, unique_id='metrics-before-call')
+    events.register('after-call', _after_call, unique_id='metrics-after-call')
+    events.register('after-call-error', _after_call, unique_id='metrics-after-call-error')
+
+    return client
@@ -0,0 +1,87 @@
+import base64
+import binascii
+import json
+import os
+
+from decimal import Decimal
+
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidPageSize(ValueError):
+    pass
+
+
+def _encode_number(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'{type(value).__name__} is not json serializable')
+
+
+def encode_cursor(last_evaluated_key):
+    """Opaque continuation token for a LastEvaluatedKey, None once there are no more pages."""
+    if not last_evaluated_key:
+        return None
+
+    raw = json.dumps(last_evaluated_key, default=_encode_number, separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw, parse_float=Decimal, parse_int=Decimal)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor('malformed cursor')
+    if not isinstance(key, dict) or not key:
+        raise InvalidCursor('malformed cursor')
+
+    return key
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value is None:
+        return default
+
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidPageSize('page size must be an integer')
+
+    return max(1, min(value, maximum))
+
+
+def fetch_page(operation, cursor=None, limit=DEFAULT_PAGE_SIZE, **kwargs):
+    """
+    One page of a table's `scan` or `query`.
+
+    DynamoDB can return fewer than `limit` items, or none at all, before the
+    end of the table. Callers stop when NextCursor is None, not on a short page.
+    """
+    start_key = decode_cursor(cursor)
+    if not start_key:
+        resp = operation(Limit=limit, **kwargs)
+    else:
+        try:
+            resp = operation(Limit=limit, ExclusiveStartKey=start_key, **kwargs)
+        except Exception as err:
+            # a crafted or stale cursor whose key doesn't fit the table or index
+            if getattr(err, 'response', {}).get('Error', {}).get('Code') != 'ValidationException':
+                raise
+            raise InvalidCursor('cursor does not match the table') from err
+
+    return {
+        'Items': resp['Items'],
+        'Count': resp['Count'],
+        'NextCursor': encode_cursor(resp.get('LastEvaluatedKey'))
+    }
@@ -0,0 +1,119 @@
+import collections
+import json
+import os
+import threading
+import uuid
+
+from aws_clients import get_sqs
+
+
+PAYMENT_QUEUE_URL = os.environ.get('PAYMENT_QUEUE_URL')
+# directory of the file backed local queue, the local queue lives in memory when unset.
+# In lambda the local queue is only used when this is set
+LOCAL_PAYMENT_QUEUE_DIR = os.environ.get('LOCAL_PAYMENT_QUEUE_DIR')
+
+
+class SqsQueue:
+    def __init__(self, queue_url):
+        self.queue_url = queue_url
+
+    def send(self, message, deduplication_id=None, group_id=None):
+        kwargs = {'QueueUrl': self.queue_url, 'MessageBody': json.dumps(message)}
+        if self.queue_url.endswith('.fifo'):
+            deduplication_id = deduplication_id or uuid.uuid4().hex
+            # a failing message only holds back the later ones of its own group
+            kwargs['MessageGroupId'] = group_id or deduplication_id
+            kwargs['MessageDeduplicationId'] = deduplication_id
+
+        get_sqs().send_message(**kwargs)
+
+    def receive(self, max_messages=10):
+        resp = get_sqs().receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=max_messages,
+            WaitTimeSeconds=1
+        )
+
+        return [(ii['ReceiptHandle'], json.loads(ii['Body'])) for ii in resp.get('Messages', [])]
+
+    def delete(self, receipt):
+        get_sqs().delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+
+class LocalQueue:
+    """
+    Stand-in for SqsQueue when running without AWS.
+
+    Messages are kept in memory, or as one json file each in `directory` so
+    that a separate worker process can drain them. A received message stays
+    queued until it is deleted.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._messages = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def send(self, message, deduplication_id=None, group_id=None):
+        message_id = deduplication_id or uuid.uuid4().hex
+        if not self.directory:
+            with self._lock:
+                self._messages.setdefault(message_id, message)
+            return
+
+        path = os.path.join(self.directory, f'{message_id}.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(message, f)
+        # readers never see a partially written message
+        os.replace(tmp_path, path)
+
+    def receive(self, max_messages=10):
+        if not self.directory:
+            with self._lock:
+                return list(self._messages.items())[:max_messages]
+
+        paths = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.json')),
+            key=os.path.getmtime
+        )
+        messages = []
+        for path in paths[:max_messages]:
+            with open(path) as f:
+                messages.append((path, json.load(f)))
+
+        return messages
+
+    def delete(self, receipt):
+        if not self.directory:
+            with self._lock:
+                self._messages.pop(receipt, None)
+            return
+
+        try:
+            os.remove(receipt)
+        except FileNotFoundError:
+            pass
+
+
+_queue = None
+
+
+def get_payment_queue():
+    """
+    SqsQueue of PAYMENT_QUEUE_URL, or a LocalQueue when explicitly opted into
+    with LOCAL_PAYMENT_QUEUE_DIR or when running outside lambda.
+
+    None in a lambda without either, where an in-memory queue would lose
+    every payment event. Payments are then finished without a queue.
+    """
+    global _queue
+    if _queue is None:
+        if PAYMENT_QUEUE_URL:
+            _queue = SqsQueue(PAYMENT_QUEUE_URL)
+        elif LOCAL_PAYMENT_QUEUE_DIR or not os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+            _queue = LocalQueue(LOCAL_PAYMENT_QUEUE_DIR)
+
+    return _queue
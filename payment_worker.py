@@ -0,0 +1,76 @@
+"""
+Worker for the Stripe events the checkout webhook enqueues.
+
+Deployed as its own lambda (payment_worker.yaml) triggered by the
+PAYMENT_QUEUE_URL queue with ReportBatchItemFailures enabled. Locally, run
+`python payment_worker.py` to drain LOCAL_PAYMENT_QUEUE_DIR.
+"""
+import json
+import time
+
+import metrics
+
+from log_utils import end_request, get_logger, start_request
+from payment_queue import get_payment_queue
+from utils import handle_successful_payment
+
+
+logger = get_logger(__name__)
+
+
+def process_event(event):
+    # log lines of one payment share the stripe event id
+    token = start_request(event.get('id'))
+    metrics_token = metrics.start_request('payment_worker')
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        if event['type'] == 'checkout.session.completed':
+            handle_successful_payment(event['data']['object'])
+        else:
+            logger.warning('Skipping unexpected stripe event type', event_type=event['type'])
+        status_code = 200
+    finally:
+        metrics.end_request(metrics_token, (time.perf_counter() - start) * 1000, status_code)
+        end_request(token)
+
+
+def handler(event, context):
+    failures = []
+    for record in event['Records']:
+        try:
+            process_event(json.loads(record['body']))
+        except Exception:
+            logger.exception('Error processing stripe event', message_id=record['messageId'])
+            failures.append({'itemIdentifier': record['messageId']})
+
+    return {'batchItemFailures': failures}
+
+
+def drain(queue=None, max_messages=10):
+    """Process queued events until none or only failing ones are left, returns how many were processed."""
+    queue = queue or get_payment_queue()
+    processed = 0
+    while True:
+        messages = queue.receive(max_messages)
+        if not messages:
+            return processed
+
+        failed = 0
+        for receipt, event in messages:
+            try:
+                process_event(event)
+            except Exception:
+                # leave it queued for the next drain
+                logger.exception('Error processing stripe event', event_id=event.get('id'))
+                failed += 1
+                continue
+            queue.delete(receipt)
+            processed += 1
+
+        if failed == len(messages):
+            return processed
+
+
+if __name__ == '__main__':
+    print(f'Processed {drain()} stripe events')
@@ -1,5 +1,7 @@
 import json
 
+from fastapi.responses import JSONResponse
+
 
 response_headers = {
     "Content-Type": "application/json",
@@ -71,6 +73,13 @@ missing_file_contents = {
 }
 
 
+uploaded_file_not_found = {
+    "statusCode": 400,
+    "headers": response_headers,
+    "body": json.dumps({"error": "uploaded file not found"})
+}
+
+
 invalid_signature = {
     "statusCode": 400,
     "headers": response_headers,
@@ -78,6 +87,23 @@ invalid_signature = {
 }
 
 
+def payment_enqueue_failed():
+    # a real http 500, stripe only redelivers a webhook on a non 2xx status
+    return JSONResponse(
+        status_code=500,
+        headers=response_headers,
+        content={"error": "could not queue payment event"}
+    )
+
+
+def payment_processing_failed():
+    return JSONResponse(
+        status_code=500,
+        headers=response_headers,
+        content={"error": "could not process payment event"}
+    )
+
+
 unknown_event_type = {
     "statusCode": 400,
     "headers": response_headers,
@@ -102,3 +128,16 @@ incorrect_price = {
     "body": json.dumps({"error": "incorrect price"})
 }
 
+
+invalid_cursor = {
+    "statusCode": 400,
+    "headers": response_headers,
+    "body": json.dumps({"error": "invalid pagination cursor"})
+}
+
+
+invalid_page_size = {
+    "statusCode": 400,
+    "headers": response_headers,
+    "body": json.dumps({"error": "page size must be an integer"})
+}
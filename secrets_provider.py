@@ -0,0 +1,80 @@
+import base64
+import binascii
+import os
+
+from aws_clients import get_kms
+from cache_utils import ExpiringLRUCache
+from log_utils import get_logger
+
+
+SECRETS_TTL = int(os.environ.get('SECRETS_TTL', 900))
+# how long a value KMS failed to decrypt is used as is before decrypting it again
+SECRETS_FALLBACK_TTL = int(os.environ.get('SECRETS_FALLBACK_TTL', 30))
+
+logger = get_logger(__name__)
+
+_secrets = ExpiringLRUCache(maxsize=32, default_ttl=SECRETS_TTL)
+
+
+def _decrypt(env_name, encryption_context=None):
+    """(value, ttl) of `env_name`, ttl is how long the value may be cached."""
+    value = os.getenv(env_name)
+    if value is None:
+        return None, None
+
+    try:
+        ciphertext = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        # not encrypted (local runs, unit tests): use it as is
+        return value, SECRETS_TTL
+
+    try:
+        kwargs = {'CiphertextBlob': ciphertext}
+        if encryption_context:
+            kwargs['EncryptionContext'] = encryption_context() if callable(encryption_context) else encryption_context
+        return get_kms().decrypt(**kwargs)['Plaintext'].decode(), SECRETS_TTL
+    except Exception:
+        # possibly plaintext that happens to be valid base64, possibly a
+        # passing KMS failure: use it as is, but try again soon
+        logger.exception('Could not decrypt secret, using it as is', secret=env_name)
+        return value, SECRETS_FALLBACK_TTL
+
+
+def get_secret(env_name, encryption_context=None):
+    """
+    Plaintext of the KMS encrypted environment variable `env_name`.
+
+    Decrypted once per container and again every SECRETS_TTL seconds. Values
+    that can't be decrypted are returned as they are in the environment, and
+    decrypted again after SECRETS_FALLBACK_TTL seconds.
+    """
+    value = _secrets.get(env_name)
+    if value is None:
+        value, ttl = _decrypt(env_name, encryption_context)
+        if value is not None:
+            _secrets.set(env_name, value, ttl=ttl)
+
+    return value
+
+
+def clear_secrets():
+    _secrets.clear()
+
+
+def get_stripe_api_key():
+    return get_secret('STRIPE_API_KEY')
+
+
+def get_checkout_session_webhook_secret():
+    return get_secret(
+        'CHECKOUT_SESSION_WEBHOOK_SECRET',
+        lambda: {'LambdaFunctionName': os.environ['AWS_LAMBDA_FUNCTION_NAME']}
+    )
+
+
+def get_docusign_credentials():
+    return {
+        'client_id': get_secret('DS_CLIENT_ID'),
+        'client_secret': get_secret('DS_CLIENT_SECRET'),
+        'refresh_token': get_secret('DS_REFRESH_TOKEN')
+    }
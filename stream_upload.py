@@ -0,0 +1,94 @@
+import binascii
+import os
+import re
+
+
+# S3 requires every part but the last to be at least 5 MiB
+UPLOAD_PART_SIZE = max(int(os.environ.get('UPLOAD_PART_SIZE', 5 * 1024 * 1024)), 5 * 1024 * 1024)
+# base64 characters decoded per step
+DECODE_CHUNK_CHARS = 256 * 1024
+# what base64.b64decode skips as well, e.g. the newlines of line wrapped base64
+_NON_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+def iter_base64_chunks(b64string, start=0, max_bytes=None, chunk_chars=DECODE_CHUNK_CHARS):
+    """
+    Decode `b64string` from `start` on in fixed size steps.
+
+    Only one step of the encoded string and its decoded bytes are alive at a
+    time, and FileTooLargeError is raised as soon as more than `max_bytes`
+    have been decoded.
+    """
+    decoded_size = 0
+    leftover = ''
+    for pos in range(start, len(b64string), chunk_chars):
+        chunk = leftover + _NON_BASE64.sub('', b64string[pos:pos + chunk_chars])
+        # only whole 4 character quanta are decoded, the rest waits for the next step
+        usable = len(chunk) - len(chunk) % 4
+        leftover = chunk[usable:]
+        if not usable:
+            continue
+
+        data = binascii.a2b_base64(chunk[:usable])
+        decoded_size += len(data)
+        if max_bytes is not None and decoded_size > max_bytes:
+            raise FileTooLargeError
+
+        yield data
+
+    if leftover:
+        # a truncated quantum, raises binascii.Error like base64.b64decode does
+        yield binascii.a2b_base64(leftover)
+
+
+def upload_base64(client, bucket, key, b64string, start=0, max_bytes=None, part_size=UPLOAD_PART_SIZE):
+    """
+    Stream a base64 string into S3 without holding the decoded file in memory.
+
+    Files smaller than one part are stored with a single put_object, anything
+    larger goes through a multipart upload fed `part_size` bytes at a time.
+    The multipart upload is aborted if decoding or any part fails.
+    """
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+
+    def _upload_part(body):
+        resp = client.upload_part(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=len(parts) + 1,
+            Body=body
+        )
+        parts.append({'ETag': resp['ETag'], 'PartNumber': len(parts) + 1})
+
+    try:
+        for data in iter_base64_chunks(b64string, start, max_bytes):
+            buffer += data
+            while len(buffer) >= part_size:
+                if upload_id is None:
+                    upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+                _upload_part(bytes(memoryview(buffer)[:part_size]))
+                del buffer[:part_size]
+
+        if upload_id is None:
+            return client.put_object(Bucket=bucket, Key=key, Body=bytes(buffer))
+
+        if buffer:
+            _upload_part(bytes(buffer))
+
+        return client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        if upload_id is not None:
+            client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
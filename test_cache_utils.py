@@ -0,0 +1,33 @@
+import time
+
+from cache_utils import ExpiringLRUCache
+
+
+def test_lru_eviction_and_counters():
+    cache = ExpiringLRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {
+        'size': 2,
+        'maxsize': 2,
+        'hits': 3,
+        'misses': 1,
+        'evictions': 1,
+        'expirations': 0
+    }
+
+
+def test_entries_expire_at_their_own_timestamp():
+    cache = ExpiringLRUCache(maxsize=10)
+    cache.set('expired', 'x', expires_at=time.time() - 1)
+    cache.set('valid', 'y', expires_at=time.time() + 60)
+
+    assert cache.get('expired') is None
+    assert cache.get('valid') == 'y'
+    assert cache.stats()['expirations'] == 1
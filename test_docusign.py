@@ -0,0 +1,38 @@
+import docusign
+
+from docusign import DocuSignTokenManager
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_access_token_is_reused_until_it_expires(monkeypatch):
+    posts = []
+
+    def fake_post(url, data, auth, **kwargs):
+        posts.append(data)
+        return FakeResponse({'access_token': f'token-{len(posts)}', 'expires_in': 3600})
+
+    monkeypatch.setattr(docusign.http_client, 'post', fake_post)
+    monkeypatch.setattr(docusign, 'get_docusign_credentials', lambda: {
+        'client_id': 'id', 'client_secret': 'secret', 'refresh_token': 'refresh'
+    })
+    manager = DocuSignTokenManager(expiry_margin=300)
+
+    assert manager.get_access_token() == 'token-1'
+    assert manager.get_access_token() == 'token-1'
+    assert posts == [{'grant_type': 'refresh_token', 'refresh_token': 'refresh'}]
+
+    manager._expires_at = 0
+    assert manager.get_access_token() == 'token-2'
+
+    manager.invalidate()
+    assert manager.get_access_token() == 'token-3'
@@ -0,0 +1,41 @@
+from form_schema import FORM_SCHEMA
+
+
+def test_is_valid_key():
+    assert FORM_SCHEMA.is_valid_key('applicant_info.first_name')
+    assert FORM_SCHEMA.is_valid_key('documents')
+    assert FORM_SCHEMA.is_valid_key('request_questions.anything_at_all')
+    assert FORM_SCHEMA.is_valid_key('verification_details_info.marital_status_something')
+    assert not FORM_SCHEMA.is_valid_key('request_questions')
+    assert not FORM_SCHEMA.is_valid_key('unknown_section.key')
+
+
+def test_is_list_type():
+    assert FORM_SCHEMA.is_list_type('contacts')
+    assert FORM_SCHEMA.is_list_type('general-vehicles')
+    assert not FORM_SCHEMA.is_list_type('general.vehicle')
+
+
+def test_section_for():
+    assert FORM_SCHEMA.section_for('state_of_service') == 'applicant'
+    assert FORM_SCHEMA.section_for('request_questions.divorce_date') == 'verify'
+    assert FORM_SCHEMA.section_for('request_questions.custom') == 'general'
+    assert FORM_SCHEMA.section_for('unknown_section.key') is None
+
+
+def test_group_attributes_follows_section_list_order():
+    item = {
+        'unknown_section.key': 1,
+        'request_questions.custom': 2,
+        'verification_details_info.marital_status_last_five_years': 3,
+        'verification_details_info.marital_status': 4,
+        'state_of_service': 5
+    }
+
+    assert FORM_SCHEMA.group_attributes(item) == [
+        ('state_of_service', 'applicant', 5),
+        ('verification_details_info.marital_status', 'verify', 4),
+        ('verification_details_info.marital_status_last_five_years', 'verify', 3),
+        ('request_questions.custom', 'general', 2)
+    ]
+    assert item == {'unknown_section.key': 1}
@@ -191,6 +191,13 @@ def test_get_applications(clear_data):
     resp = get_applications(EMAIL)
     assert type(resp) == list
 
+def test_get_applications_summary(clear_data):
+    resp = get_applications({'summary': True, 'page_size': 10})
+    assert resp['NextCursor'] is None
+    assert resp['Items'][0]['application_uuid'] == APPLICATION_UUID
+    assert resp['Items'][0]['status'] == 'in_progress'
+    assert 'documents' not in resp['Items'][0]
+
 def test_create_payment_session():
     try:
         kms = boto3.client('kms')
@@ -0,0 +1,474 @@
+"""
+Handler tests against the in-memory DynamoDB, S3, KMS, SES and Stripe
+stand-ins of local_aws.py (the `stand_ins` fixture), so they run without AWS.
+"""
+import base64
+import json
+import time
+
+import pytest
+
+import handler
+import metrics
+import payment_worker
+import utils
+
+from config import API_V1_STR
+from payment_queue import LocalQueue
+from response_helpers import (
+    forbidden_action, invalid_cursor, invalid_page_size, invalid_request,
+    max_file_size_exceeded, uploaded_file_not_found
+)
+
+EMAIL = 'jasonh@ltccs.com'
+APPLICATION_UUID = '098029483-sdfsf-234243-009023424'
+
+
+class LambdaContext:
+    aws_request_id = 'test'
+
+
+def _invoke(path, body, headers=None):
+    """`path` through the lambda handler, as an API Gateway event."""
+    path = API_V1_STR + path
+    headers = dict({'content-type': 'application/json', 'host': 'test.local'}, **(headers or {}))
+
+    return handler.handler({
+        'resource': path,
+        'path': path,
+        'httpMethod': 'POST',
+        'headers': headers,
+        'multiValueHeaders': {key: [val] for key, val in headers.items()},
+        'queryStringParameters': None,
+        'multiValueQueryStringParameters': None,
+        'requestContext': {
+            'resourcePath': path,
+            'httpMethod': 'POST',
+            'path': path,
+            'stage': 'test',
+            'identity': {'sourceIp': '127.0.0.1'}
+        },
+        'body': json.dumps(body),
+        'isBase64Encoded': False
+    }, LambdaContext())
+
+
+def test_first_write_creates_the_portal_summary_row(stand_ins):
+    detail = {'value': 'yes', 'uuid': 'x', 'created_date': 'now', 'updated_date': 'now'}
+    utils.upsert_detail(EMAIL, APPLICATION_UUID, 'general.has_medicare', detail)
+
+    row = utils.portal_summary_table.get_item(Key={'email': EMAIL, 'application_uuid': APPLICATION_UUID})['Item']
+    assert row == {'email': EMAIL, 'application_uuid': APPLICATION_UUID, 'status': 'in_progress'}
+
+    utils.update_application_status(EMAIL, APPLICATION_UUID)
+    utils.upsert_detail(EMAIL, APPLICATION_UUID, 'general.other_key', detail)
+
+    row = utils.portal_summary_table.get_item(Key={'email': EMAIL, 'application_uuid': APPLICATION_UUID})['Item']
+    assert row['status'] == 'submitted'
+
+
+@pytest.mark.parametrize('first_write', [
+    lambda: utils.update_dynamodb_batch(EMAIL, APPLICATION_UUID, {'currentScreenName': 'intake'}),
+    lambda: utils.update_dynamodb(EMAIL, APPLICATION_UUID, 'documents', []),
+    lambda: utils.append_documents(EMAIL, APPLICATION_UUID, [{'name': 'id.png'}]),
+], ids=['batch', 'list', 'documents'])
+def test_every_first_write_creates_the_portal_summary_row(stand_ins, monkeypatch, first_write):
+    first_write()
+
+    row = utils.portal_summary_table.get_item(Key={'email': EMAIL, 'application_uuid': APPLICATION_UUID})['Item']
+    assert row['status'] == 'in_progress'
+
+    # later writes without summary fields don't touch the row
+    summary_table = utils.portal_summary_table._resolve()
+    summary_writes = []
+    monkeypatch.setattr(summary_table, 'update_item', lambda **kwargs: summary_writes.append(kwargs))
+    utils.update_dynamodb_batch(EMAIL, APPLICATION_UUID, {'currentScreenName': 'income'})
+    utils.update_dynamodb(EMAIL, APPLICATION_UUID, 'documents', [])
+    utils.append_documents(EMAIL, APPLICATION_UUID, [{'name': 'bill.png'}])
+    assert summary_writes == []
+
+
+def test_update_details_batch_last_entry_wins(stand_ins):
+    resp = handler.update_details_batch({
+        'application_uuid': APPLICATION_UUID,
+        'updates': [
+            {'key_to_update': 'applicant_info.first_name', 'value_to_update': 'Jane'},
+            {'key_to_update': 'state_of_service', 'value_to_update': 'FL'},
+            {'key_to_update': 'applicant_info.first_name', 'value_to_update': 'Janet'},
+        ]
+    })
+
+    item = resp['Item']
+    assert item['applicant_info.first_name']['value'] == 'Janet'
+    assert item['state_of_service']['value'] == 'FL'
+
+    # details saved earlier keep their uuid and created_date
+    first_name = item['applicant_info.first_name']
+    item = handler.update_details_batch({
+        'application_uuid': APPLICATION_UUID,
+        'updates': [{'key_to_update': 'applicant_info.first_name', 'value_to_update': 'Jo'}]
+    })['Item']
+    assert item['applicant_info.first_name']['uuid'] == first_name['uuid']
+    assert item['applicant_info.first_name']['created_date'] == first_name['created_date']
+
+
+def test_update_details_batch_rejects_empty_and_oversized_batches(stand_ins, monkeypatch):
+    assert handler.update_details_batch({'application_uuid': APPLICATION_UUID, 'updates': []}) == invalid_request
+
+    monkeypatch.setattr(handler, 'MAX_BATCH_UPDATE_KEYS', 2)
+    updates = [{'key_to_update': f'request_questions.q{ii}', 'value_to_update': ii} for ii in range(3)]
+    assert handler.update_details_batch({'application_uuid': APPLICATION_UUID, 'updates': updates}) == invalid_request
+    assert 'Item' not in utils.table.get_item(Key={'email': EMAIL, 'application_uuid': APPLICATION_UUID})
+
+
+def test_create_upload_urls_picks_post_or_put(stand_ins):
+    resp = handler.create_upload_urls({
+        'application_uuid': APPLICATION_UUID,
+        'document_type': 'identity',
+        'files': [
+            {'file_name': 'a.png', 'content_type': 'image/png'},
+            {'file_name': 'b.pdf', 'content_type': 'application/pdf', 'file_size': 1024},
+        ]
+    })
+
+    assert [upload['method'] for upload in resp] == ['POST', 'PUT']
+    assert [upload['file_name'] for upload in resp] == ['a.png', 'b.pdf']
+    assert resp[1]['headers'] == {'Content-Type': 'application/pdf'}
+
+    too_large = {'file_name': 'c.pdf', 'file_size': utils.MAX_FILE_SIZE_BYTES + 1}
+    resp = handler.create_upload_urls({'application_uuid': APPLICATION_UUID, 'document_type': 'identity', 'files': [too_large]})
+    assert resp == max_file_size_exceeded
+
+
+@pytest.mark.parametrize('file_size', ['1024', -1, 1.5, True, {}])
+def test_create_upload_urls_rejects_invalid_file_sizes(stand_ins, file_size):
+    resp = handler.create_upload_urls({
+        'application_uuid': APPLICATION_UUID,
+        'document_type': 'identity',
+        'files': [{'file_name': 'a.pdf', 'file_size': file_size}]
+    })
+
+    assert resp == invalid_request
+
+
+def _finalize(*file_names):
+    return handler.finalize_upload({
+        'application_uuid': APPLICATION_UUID,
+        'associated_medicaid_detail_uuid': 'detail-1',
+        'document_type': 'identity',
+        'files': [{'file_name': file_name} for file_name in file_names]
+    })
+
+
+def test_finalize_upload(stand_ins):
+    client = utils.s3.meta.client
+    key = utils.get_file_key(EMAIL, APPLICATION_UUID, 'identity', 'a.png')
+
+    assert _finalize('a.png') == uploaded_file_not_found
+
+    client.put_object(Bucket=utils.BUCKET_NAME, Key=key, Body=b'x' * 10)
+    documents = _finalize('a.png')['Item']['documents']
+    assert [doc['document_name'] for doc in documents] == ['a.png']
+    assert 's3_location' not in documents[0]
+
+
+def test_finalize_upload_deletes_oversized_objects(stand_ins, monkeypatch):
+    monkeypatch.setattr(handler, 'MAX_FILE_SIZE_BYTES', 5)
+    client = utils.s3.meta.client
+    key = utils.get_file_key(EMAIL, APPLICATION_UUID, 'identity', 'big.png')
+    client.put_object(Bucket=utils.BUCKET_NAME, Key=key, Body=b'x' * 10)
+
+    assert _finalize('big.png') == max_file_size_exceeded
+    assert utils.get_uploaded_file_size(key) is None
+
+
+def test_finalize_upload_records_confirmed_files_when_others_fail(stand_ins):
+    client = utils.s3.meta.client
+    key = utils.get_file_key(EMAIL, APPLICATION_UUID, 'identity', 'a.png')
+    client.put_object(Bucket=utils.BUCKET_NAME, Key=key, Body=b'x' * 10)
+
+    resp = _finalize('a.png', 'missing.png')
+
+    assert [doc['document_name'] for doc in resp['Item']['documents']] == ['a.png']
+    assert resp['FailedFiles'] == [{'file_name': 'missing.png', 'error': 'uploaded file not found'}]
+
+
+def test_failed_enqueue_is_an_http_500(stand_ins, monkeypatch):
+    class FailingQueue:
+        def send(self, message, deduplication_id=None, group_id=None):
+            raise RuntimeError('sqs is down')
+
+    monkeypatch.setattr(handler, 'get_payment_queue', FailingQueue)
+    checkout_event = {
+        'id': 'evt_1',
+        'type': 'checkout.session.completed',
+        'data': {'object': {'customer_email': EMAIL, 'client_reference_id': APPLICATION_UUID}}
+    }
+
+    resp = _invoke('/completed-checkout-session', checkout_event, {'Stripe-Signature': 'test'})
+
+    assert resp['statusCode'] == 500
+    assert json.loads(resp['body']) == {'error': 'could not queue payment event'}
+
+
+def test_payment_is_finished_inline_without_a_queue(stand_ins, monkeypatch):
+    monkeypatch.setattr(handler, 'get_payment_queue', lambda: None)
+    for key, name in [('applicant_info.first_name', 'Jane'), ('applicant_info.last_name', 'Doe')]:
+        detail = {'value': name, 'uuid': 'x', 'created_date': 'now', 'updated_date': 'now'}
+        utils.upsert_detail(EMAIL, APPLICATION_UUID, key, detail)
+    checkout_event = {
+        'id': 'evt_1',
+        'type': 'checkout.session.completed',
+        'data': {'object': {'customer_email': EMAIL, 'client_reference_id': APPLICATION_UUID, 'payment_intent': 'pi_1'}}
+    }
+
+    resp = _invoke('/completed-checkout-session', checkout_event, {'Stripe-Signature': 'test'})
+
+    assert resp['statusCode'] == 200
+    key = {'email': EMAIL, 'application_uuid': APPLICATION_UUID}
+    assert utils.payment_details_table.get_item(Key=key)['Item']['details']['id'] == 'pi_1'
+    assert utils.table.get_item(Key=key)['Item']['submitted_date']
+
+
+def test_failed_payment_step_is_retried_without_repeating_the_others(stand_ins, monkeypatch):
+    for key, name in [('applicant_info.first_name', 'Jane'), ('applicant_info.last_name', 'Doe')]:
+        detail = {'value': name, 'uuid': 'x', 'created_date': 'now', 'updated_date': 'now'}
+        utils.upsert_detail(EMAIL, APPLICATION_UUID, key, detail)
+
+    sent = []
+
+    def send_email(subject, to_emails, body, attachment_string=None):
+        if not sent:
+            sent.append(None)
+            raise RuntimeError('ses is down')
+        sent.append(body)
+
+    monkeypatch.setattr(utils, 'send_email', send_email)
+    queue = LocalQueue()
+    queue.send({
+        'id': 'evt_1',
+        'type': 'checkout.session.completed',
+        'data': {'object': {'customer_email': EMAIL, 'client_reference_id': APPLICATION_UUID, 'payment_intent': 'pi_1'}}
+    }, deduplication_id='evt_1')
+
+    # the email failed, the other steps still ran and the event stays queued
+    assert payment_worker.drain(queue) == 0
+    assert len(queue.receive()) == 1
+    key = {'email': EMAIL, 'application_uuid': APPLICATION_UUID}
+    submitted_date = utils.table.get_item(Key=key)['Item']['submitted_date']
+    assert utils.payment_details_table.get_item(Key=key)['Item']['details']['id'] == 'pi_1'
+
+    assert payment_worker.drain(queue) == 1
+    utils.handle_successful_payment({'customer_email': EMAIL, 'client_reference_id': APPLICATION_UUID, 'payment_intent': 'pi_1'})
+
+    assert sent == [None, f'Jane Doe submitted application. Email: {EMAIL}. Application Id: {APPLICATION_UUID}']
+    assert utils.table.get_item(Key=key)['Item']['submitted_date'] == submitted_date
+    row = utils.portal_summary_table.get_item(Key=key)['Item']
+    assert row['status'] == 'submitted'
+
+
+def test_parse_custom_prices():
+    assert utils.parse_custom_prices({'prices': [{'email': ' a@example.com ', 'price': ' price_1 '}]}) == {
+        'a@example.com': 'price_1'
+    }
+    assert utils.parse_custom_prices({'csv': 'email,price\na@example.com,price_1\nb@example.com,price_2\n'}) == {
+        'a@example.com': 'price_1', 'b@example.com': 'price_2'
+    }
+    assert utils.parse_custom_prices({}) == {}
+
+    for rows in ([{'email': 'a@example.com'}], [{'email': 'a@example.com', 'price': ' '}],
+                 [{'email': 'a@example.com', 'price': 12.5}], [{'price': 'price_1'}], ['a@example.com']):
+        assert utils.parse_custom_prices({'prices': rows}) is None
+    assert utils.parse_custom_prices({'csv': 'email,price\na@example.com,\n'}) is None
+
+
+def test_bulk_import_custom_prices(stand_ins, monkeypatch):
+    body = {'csv': 'email,price\na@example.com,price_1\nb@example.com,price_2'}
+
+    assert handler.bulk_import_custom_prices(body) == {'Count': 2}
+    assert utils.get_price_detail('b@example.com')['price'] == 'price_2'
+    assert handler.bulk_import_custom_prices({'prices': [{'email': 'a@example.com', 'price': 1}]}) == invalid_request
+    assert handler.bulk_import_custom_prices({'prices': []}) == invalid_request
+
+    monkeypatch.setenv('INTERNAL_USERS', 'someone.else@example.com')
+    assert handler.bulk_import_custom_prices(body) == forbidden_action
+
+
+def test_invalid_page_size_is_not_reported_as_a_cursor_error(stand_ins):
+    assert handler.get_custom_prices({'page_size': 'ten'}) == invalid_page_size
+    assert handler.get_custom_prices({'cursor': 'not a cursor'}) == invalid_cursor
+    assert handler.get_applications({'summary': True, 'page_size': 'ten'}) == invalid_page_size
+
+
+def test_requests_are_measured_per_route(stand_ins, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_BACKEND', 'memory')
+    metrics.collector.clear()
+
+    _invoke('/get-custom-prices', {})
+    _invoke('/no-such-route/12345', {})
+
+    summary = metrics.collector.summary()
+    assert summary[API_V1_STR + '/get-custom-prices']['count'] == 1
+    assert summary[metrics.UNMATCHED_ENDPOINT]['count'] == 1
+    assert not any('12345' in endpoint for endpoint in summary)
+    # fastapi releases without scope['route'] still leave the endpoint function
+    assert handler._route_path({'endpoint': handler.get_custom_prices}) == API_V1_STR + '/get-custom-prices'
+
+
+def test_completed_application_email_without_a_saved_name(stand_ins, monkeypatch):
+    sent = []
+    monkeypatch.setattr(utils, 'send_email', lambda subject, to_emails, body: sent.append(body))
+
+    utils.send_completed_application_email(EMAIL, APPLICATION_UUID)
+    utils.send_completed_application_email(EMAIL, APPLICATION_UUID)
+
+    assert sent == [f'An applicant submitted application. Email: {EMAIL}. Application Id: {APPLICATION_UUID}']
+
+
+def test_rejected_completed_application_email_is_not_retried(stand_ins, monkeypatch):
+    class MessageRejected(Exception):
+        response = {'Error': {'Code': 'MessageRejected'}}
+
+    def send_email(subject, to_emails, body):
+        raise MessageRejected('Email address is not verified')
+
+    monkeypatch.setattr(utils, 'send_email', send_email)
+    utils.send_completed_application_email(EMAIL, APPLICATION_UUID)
+
+    class Throttling(Exception):
+        response = {'Error': {'Code': 'Throttling'}}
+
+    def send_email(subject, to_emails, body):
+        raise Throttling('Maximum sending rate exceeded')
+
+    monkeypatch.setattr(utils, 'send_email', send_email)
+    with pytest.raises(Throttling):
+        utils.send_completed_application_email(EMAIL, APPLICATION_UUID)
+
+
+def test_upload_file_reports_failed_files(stand_ins, monkeypatch):
+    client = utils.s3.meta.client
+    put_object = client.put_object
+
+    def flaky_put_object(Bucket, Key, Body, **kwargs):
+        if Key.endswith('broken.png'):
+            raise RuntimeError('An error occurred (InternalError) when calling the PutObject operation')
+        return put_object(Bucket=Bucket, Key=Key, Body=Body, **kwargs)
+
+    monkeypatch.setattr(client, 'put_object', flaky_put_object)
+    document_writes = []
+    append_documents = handler.append_documents
+    monkeypatch.setattr(
+        handler, 'append_documents', lambda *args: document_writes.append(args) or append_documents(*args)
+    )
+    file_contents = 'data:image/png;base64,' + base64.b64encode(b'png').decode()
+
+    resp = handler.upload_file({
+        'application_uuid': APPLICATION_UUID,
+        'associated_medicaid_detail_uuid': 'detail',
+        'document_type': 'identity',
+        'files': [
+            {'file_name': name, 'file_contents': file_contents} for name in ('a.png', 'broken.png', 'b.png')
+        ]
+    })
+
+    assert resp['FailedFiles'] == [{'file_name': 'broken.png', 'error': 'upload failed'}]
+    assert [doc['document_name'] for doc in resp['Item']['documents']] == ['a.png', 'b.png']
+    assert len(document_writes) == 1
+    assert (utils.BUCKET_NAME, utils.get_file_key(EMAIL, APPLICATION_UUID, 'identity', 'broken.png')) not in client.objects
+
+
+def test_price_cache_is_invalidated_by_new_custom_prices(stand_ins):
+    utils.stripe_price_table.put_item(Item={'price_id': 'price_standard', 'standard': 1})
+
+    # both users have no custom price yet, which is cached along with the standard price
+    assert utils.get_price_detail('a@example.com')['price_id'] == 'price_standard'
+    assert utils.get_price_detail('b@example.com')['price_id'] == 'price_standard'
+    utils.custom_price_table.put_item(Item={'email': 'a@example.com', 'price': 'price_behind_the_cache'})
+    assert utils.get_price_detail('a@example.com')['price_id'] == 'price_standard'
+
+    handler.create_custom_price({'email': 'a@example.com', 'price': 'price_a'})
+    handler.bulk_import_custom_prices({'prices': [{'email': 'b@example.com', 'price': 'price_b'}]})
+
+    assert utils.get_price_detail('a@example.com')['price'] == 'price_a'
+    assert utils.get_price_detail('b@example.com')['price'] == 'price_b'
+    assert utils.get_price_detail('c@example.com')['price_id'] == 'price_standard'
+
+    utils.stripe_price_table.put_item(Item={'price_id': 'price_standard', 'standard': 0})
+    utils.stripe_price_table.put_item(Item={'price_id': 'price_new_standard', 'standard': 1})
+    assert utils.get_standard_price()['price_id'] == 'price_standard'
+    utils.invalidate_price_cache()
+    assert utils.get_standard_price()['price_id'] == 'price_new_standard'
+
+
+def _upload(file_names, detail_uuid='detail'):
+    file_contents = 'data:image/png;base64,' + base64.b64encode(b'png').decode()
+    handler.upload_file({
+        'application_uuid': APPLICATION_UUID,
+        'associated_medicaid_detail_uuid': detail_uuid,
+        'document_type': 'identity',
+        'files': [{'file_name': name, 'file_contents': file_contents} for name in file_names]
+    })
+
+
+def test_get_files_inline(stand_ins):
+    _upload(['a.png', 'b.png'])
+    _upload(['other.png'], detail_uuid='other-detail')
+
+    resp = handler.get_files({'application_uuid': APPLICATION_UUID, 'uuid': 'detail'})
+
+    assert resp == [
+        {'document_name': 'a.png', 'image': base64.b64encode(b'png')},
+        {'document_name': 'b.png', 'image': base64.b64encode(b'png')}
+    ]
+
+
+def test_get_files_urls_are_reused_while_valid(stand_ins, monkeypatch):
+    _upload(['a.png', 'b.png'])
+    client = utils.s3.meta.client
+    generated = []
+    generate_presigned_url = client.generate_presigned_url
+
+    def counting_generate_presigned_url(ClientMethod, Params, **kwargs):
+        generated.append(Params['Key'])
+        return generate_presigned_url(ClientMethod, Params, **kwargs)
+
+    monkeypatch.setattr(client, 'generate_presigned_url', counting_generate_presigned_url)
+    body = {'application_uuid': APPLICATION_UUID, 'uuid': 'detail', 'mode': 'url'}
+
+    first = handler.get_files(body)
+    assert [doc['document_name'] for doc in first] == ['a.png', 'b.png']
+    assert all('image' not in doc and doc['url'].startswith('https://') for doc in first)
+    assert handler.get_files(body) == first
+    assert len(generated) == 2
+
+    # a cached url is only handed out while it has DOWNLOAD_URL_MIN_VALIDITY left
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + utils.DOWNLOAD_URL_EXPIRATION - utils.DOWNLOAD_URL_MIN_VALIDITY + 1)
+    handler.get_files(body)
+    assert len(generated) == 4
+
+
+def test_parallel_scan_merges_segments_and_follows_pages():
+    # segment -> pages of items, each page but the last ends with a LastEvaluatedKey
+    pages = {0: [[1, 2], [3]], 1: [[]], 2: [[4], [], [5, 6]]}
+    calls = []
+
+    class Client:
+        def scan(self, TableName, Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+            calls.append((Segment, ExclusiveStartKey, kwargs))
+            page = ExclusiveStartKey['page'] if ExclusiveStartKey else 0
+            resp = {'Items': pages[Segment][page]}
+            if page + 1 < len(pages[Segment]):
+                resp['LastEvaluatedKey'] = {'page': page + 1}
+            return resp
+
+    table = type('Table', (), {'name': 'table', 'meta': type('Meta', (), {'client': Client()})})()
+
+    items = utils.parallel_scan(table, total_segments=3, ProjectionExpression='email')
+
+    assert items == [1, 2, 3, 4, 5, 6]
+    assert sorted((segment, start_key['page'] if start_key else 0) for segment, start_key, _ in calls) == [
+        (0, 0), (0, 1), (1, 0), (2, 0), (2, 1), (2, 2)
+    ]
+    assert all(kwargs == {'ProjectionExpression': 'email'} for _, _, kwargs in calls)
@@ -0,0 +1,67 @@
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+import http_client
+
+
+@pytest.fixture
+def unavailable_server(monkeypatch):
+    """Local server answering every request with a 503, yields (url, list of request methods it saw)."""
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def _unavailable(self):
+            seen.append(self.command)
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_GET = do_PUT = do_DELETE = do_POST = _unavailable
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(http_client, 'HTTP_BACKOFF_FACTOR', 0)
+    monkeypatch.setattr(http_client, '_sessions', {})
+    yield f'http://127.0.0.1:{server.server_port}/', seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_default_timeout(monkeypatch):
+    timeouts = []
+
+    def fake_request(self, method, url, **kwargs):
+        timeouts.append(kwargs['timeout'])
+
+    monkeypatch.setattr(requests.Session, 'request', fake_request)
+    http_client.get('https://example.com/a')
+    http_client.post('https://example.com/b', timeout=1)
+
+    assert timeouts == [(http_client.HTTP_CONNECT_TIMEOUT, http_client.HTTP_READ_TIMEOUT), 1]
+
+
+@pytest.mark.parametrize('method', ['GET', 'PUT', 'DELETE'])
+def test_idempotent_methods_are_retried(unavailable_server, method):
+    url, seen = unavailable_server
+
+    resp = http_client.request(method, url)
+
+    assert resp.status_code == 503
+    assert seen == [method] * (1 + http_client.HTTP_MAX_RETRIES)
+
+
+def test_post_is_not_retried(unavailable_server):
+    url, seen = unavailable_server
+
+    resp = http_client.post(url)
+
+    assert resp.status_code == 503
+    assert seen == ['POST']
@@ -0,0 +1,66 @@
+import pytest
+
+import jwt_utils
+from jwt_utils import JwksCache
+
+
+JWKS_1 = {'keys': [{'kid': 'key-1'}]}
+JWKS_2 = {'keys': [{'kid': 'key-1'}, {'kid': 'key-2'}]}
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    calls = []
+    responses = [JWKS_1, JWKS_2]
+
+    def fake_get_jwks(url):
+        calls.append(url)
+        resp = responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+    monkeypatch.setattr(jwt_utils, 'get_jwks', fake_get_jwks)
+    return responses, calls
+
+
+def test_jwks_cache_fetches_once(fetches):
+    responses, calls = fetches
+    cache = JwksCache('https://example.com/jwks.json', ttl=3600)
+
+    assert cache.get('key-1') == JWKS_1
+    assert cache.get('key-1') == JWKS_1
+    assert len(calls) == 1
+
+
+def test_jwks_cache_refreshes_on_unknown_kid(fetches):
+    responses, calls = fetches
+    cache = JwksCache('https://example.com/jwks.json', ttl=3600, min_refresh_interval=0)
+
+    cache.get('key-1')
+    assert cache.get('key-2') == JWKS_2
+    assert len(calls) == 2
+
+
+def test_jwks_cache_falls_back_to_stale_copy(fetches):
+    responses, calls = fetches
+    responses[1] = Exception('cognito is down')
+    cache = JwksCache('https://example.com/jwks.json', ttl=0, min_refresh_interval=0)
+
+    cache.get('key-1')
+    assert cache.refresh() == JWKS_1
+
+
+def test_verifier_registry_reuses_keys_per_jwks_version(monkeypatch):
+    constructed = []
+    monkeypatch.setattr(jwt_utils.jwk, 'construct', lambda key: constructed.append(key) or key)
+    registry = jwt_utils.VerifierRegistry()
+
+    assert registry.get('key-1', JWKS_1) == {'kid': 'key-1'}
+    assert registry.get('key-1', JWKS_1) == {'kid': 'key-1'}
+    assert registry.get('key-2', JWKS_1) is None
+    assert len(constructed) == 1
+
+    registry.get('key-2', JWKS_2)
+    registry.get('key-1', JWKS_2)
+    assert len(constructed) == 3
@@ -0,0 +1,51 @@
+import io
+import json
+
+import log_utils
+
+from log_utils import JsonLogger, end_request, render_field, start_request
+
+
+def _lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_lines_carry_the_request_correlation_id():
+    stream = io.StringIO()
+    logger = JsonLogger('test', stream=stream)
+
+    token = start_request('abc')
+    logger.info('inside', application_uuid='x')
+    end_request(token)
+    logger.info('outside')
+
+    inside, outside = _lines(stream)
+    assert inside['correlation_id'] == 'abc'
+    assert inside['application_uuid'] == 'x'
+    assert inside['level'] == 'INFO'
+    assert 'correlation_id' not in outside
+
+
+def test_debug_only_for_sampled_requests(monkeypatch):
+    stream = io.StringIO()
+    logger = JsonLogger('test', stream=stream)
+    monkeypatch.setattr(log_utils, 'LOG_LEVEL', log_utils.LEVELS['INFO'])
+
+    monkeypatch.setattr(log_utils, 'LOG_DEBUG_SAMPLE_RATE', 0)
+    token = start_request()
+    logger.debug('dropped', payload={'a': 1})
+    end_request(token)
+
+    monkeypatch.setattr(log_utils, 'LOG_DEBUG_SAMPLE_RATE', 1)
+    token = start_request()
+    logger.debug('sampled', payload={'a': 1})
+    end_request(token)
+
+    assert [line['message'] for line in _lines(stream)] == ['sampled']
+
+
+def test_fields_are_capped():
+    assert render_field({'a': 1}, max_chars=20) == {'a': 1}
+    assert render_field('x' * 30, max_chars=10) == 'x' * 10 + '...<20 more chars>'
+    assert render_field({'a': 'x' * 30}, max_chars=10).startswith('{"a":"xxxx...<')
+    assert render_field(5) == 5
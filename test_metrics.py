@@ -0,0 +1,68 @@
+import json
+
+import boto3
+
+from botocore.awsrequest import AWSResponse
+
+import metrics
+
+
+def test_emf_lines_per_request_and_dependency(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, 'METRICS_BACKEND', 'emf')
+
+    token = metrics.start_request('/api/update-details')
+    metrics.record('dynamodb', 12.5)
+    metrics.record('dynamodb', 7.5)
+    metrics.record('jwks', 30)
+    metrics.end_request(token, 55.0, 200)
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    request, dynamodb, jwks = lines
+    assert request['Endpoint'] == '/api/update-details'
+    assert request['Duration'] == 55.0
+    assert request['Errors'] == 0
+    assert request['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Endpoint']]
+    assert dynamodb['Dependency'] == 'dynamodb'
+    assert dynamodb['Latency'] == [12.5, 7.5]
+    assert dynamodb['Calls'] == 2
+    assert dynamodb['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Endpoint', 'Dependency']]
+    assert jwks['Latency'] == [30]
+
+
+def test_memory_collector_summary(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_BACKEND', 'memory')
+    metrics.collector.clear()
+
+    for duration in (10, 20, 30):
+        token = metrics.start_request('/api/get-price')
+        metrics.record('dynamodb', duration / 2)
+        metrics.end_request(token, duration, 500 if duration == 30 else 200)
+    metrics.record('kms', 40)
+
+    summary = metrics.collector.summary()
+    assert summary['/api/get-price']['count'] == 3
+    assert summary['/api/get-price']['p50'] == 20
+    assert summary['/api/get-price']['errors'] == 1
+    assert summary['/api/get-price']['dependencies']['dynamodb']['max'] == 15
+    assert summary[metrics.BACKGROUND_ENDPOINT]['dependencies']['kms']['count'] == 1
+
+
+def test_boto_calls_are_timed(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_BACKEND', 'memory')
+    metrics.collector.clear()
+
+    client = boto3.client(
+        'dynamodb', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test'
+    )
+    metrics.instrument_boto_client(client)
+    # answers the call after the metrics handler started its timer, without any network
+    client.meta.events.register(
+        'before-call',
+        lambda **kwargs: (AWSResponse('https://dynamodb', 200, {}, None), {})
+    )
+
+    token = metrics.start_request('/api/get-details')
+    client.get_item(TableName='table', Key={'email': {'S': 'a'}})
+    metrics.end_request(token, 1.0, 200)
+
+    assert metrics.collector.summary()['/api/get-details']['dependencies']['dynamodb']['count'] == 1
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import pytest
+
+from pagination import InvalidCursor, InvalidPageSize, decode_cursor, encode_cursor, fetch_page, parse_page_size
+
+
+def test_cursor_round_trip():
+    key = {'email': 'a@example.com', 'application_uuid': 'abc', 'version': Decimal('3')}
+    cursor = encode_cursor(key)
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == key
+    assert encode_cursor(None) is None
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'bm90IGpzb24', encode_cursor({'a': 1})[:-3], 'WzFd'])
+def test_malformed_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_page_size_is_clamped():
+    assert parse_page_size(None, default=25) == 25
+    assert parse_page_size('10') == 10
+    assert parse_page_size(0) == 1
+    assert parse_page_size(10_000, maximum=100) == 100
+    with pytest.raises(InvalidPageSize):
+        parse_page_size('ten')
+
+
+def test_fetch_page_threads_the_cursor():
+    items = [{'email': f'user{ii}'} for ii in range(5)]
+    calls = []
+
+    def scan(Limit, ExclusiveStartKey=None, **kwargs):
+        calls.append(kwargs)
+        start = 0 if ExclusiveStartKey is None else int(ExclusiveStartKey['email'][4:]) + 1
+        page = items[start:start + Limit]
+        resp = {'Items': page, 'Count': len(page)}
+        if start + Limit < len(items):
+            resp['LastEvaluatedKey'] = page[-1]
+        return resp
+
+    seen = []
+    cursor = None
+    while True:
+        page = fetch_page(scan, cursor, limit=2, ProjectionExpression='email')
+        seen += page['Items']
+        cursor = page['NextCursor']
+        if cursor is None:
+            break
+
+    assert seen == items
+    assert all(call == {'ProjectionExpression': 'email'} for call in calls)
+
+
+def test_cursor_with_foreign_key_is_invalid():
+    class ValidationException(Exception):
+        response = {'Error': {'Code': 'ValidationException'}}
+
+    def scan(Limit, ExclusiveStartKey=None, **kwargs):
+        if ExclusiveStartKey is not None and set(ExclusiveStartKey) != {'email'}:
+            raise ValidationException('The provided starting key is invalid')
+        return {'Items': [], 'Count': 0}
+
+    assert fetch_page(scan, encode_cursor({'email': 'a@example.com'}))['NextCursor'] is None
+    with pytest.raises(InvalidCursor):
+        fetch_page(scan, encode_cursor({'id': 'x'}))
@@ -0,0 +1,102 @@
+import pytest
+
+import payment_queue
+import payment_worker
+
+from payment_queue import LocalQueue
+
+
+CHECKOUT_EVENT = {
+    'id': 'evt_1',
+    'type': 'checkout.session.completed',
+    'data': {
+        'object': {
+            'customer_email': 'jasonh@ltccs.com',
+            'client_reference_id': '098029483-sdfsf-234243-009023424',
+            'payment_intent': 'pi_1'
+        }
+    }
+}
+
+
+@pytest.fixture(params=['memory', 'files'])
+def queue(request, tmp_path):
+    return LocalQueue(str(tmp_path) if request.param == 'files' else None)
+
+
+@pytest.fixture
+def handled(monkeypatch):
+    sessions = []
+    monkeypatch.setattr(payment_worker, 'handle_successful_payment', sessions.append)
+    return sessions
+
+
+def test_local_queue_keeps_messages_until_deleted(queue):
+    queue.send(CHECKOUT_EVENT, deduplication_id='evt_1')
+    queue.send(CHECKOUT_EVENT, deduplication_id='evt_1')
+
+    messages = queue.receive()
+    assert [message for _, message in messages] == [CHECKOUT_EVENT]
+    assert len(queue.receive()) == 1
+
+    queue.delete(messages[0][0])
+    assert queue.receive() == []
+
+
+def test_drain_processes_checkout_sessions(queue, handled):
+    queue.send(CHECKOUT_EVENT, deduplication_id='evt_1')
+    queue.send(dict(CHECKOUT_EVENT, id='evt_2'), deduplication_id='evt_2')
+
+    assert payment_worker.drain(queue) == 2
+    assert handled == [CHECKOUT_EVENT['data']['object']] * 2
+    assert queue.receive() == []
+
+
+def test_drain_leaves_failing_events_queued(queue, monkeypatch):
+    def fail(checkout_session):
+        raise RuntimeError('dynamodb is down')
+
+    monkeypatch.setattr(payment_worker, 'handle_successful_payment', fail)
+    queue.send(CHECKOUT_EVENT, deduplication_id='evt_1')
+
+    assert payment_worker.drain(queue) == 0
+    assert len(queue.receive()) == 1
+
+
+def test_sqs_handler_reports_failed_records(handled):
+    event = {'Records': [
+        {'messageId': 'm1', 'body': '{"id": "evt_1", "type": "checkout.session.completed", "data": {"object": {}}}'},
+        {'messageId': 'm2', 'body': 'not json'}
+    ]}
+
+    assert payment_worker.handler(event, None) == {'batchItemFailures': [{'itemIdentifier': 'm2'}]}
+    assert handled == [{}]
+
+
+def test_lambda_without_a_queue_url_has_no_queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(payment_queue, '_queue', None)
+    monkeypatch.setattr(payment_queue, 'PAYMENT_QUEUE_URL', None)
+    monkeypatch.setattr(payment_queue, 'LOCAL_PAYMENT_QUEUE_DIR', None)
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'turbocaid')
+
+    assert payment_queue.get_payment_queue() is None
+
+    monkeypatch.setattr(payment_queue, 'LOCAL_PAYMENT_QUEUE_DIR', str(tmp_path))
+    assert isinstance(payment_queue.get_payment_queue(), LocalQueue)
+
+
+def test_sqs_messages_are_grouped_per_application(monkeypatch):
+    sent = []
+
+    class FakeSqs:
+        def send_message(self, **kwargs):
+            sent.append(kwargs)
+
+    monkeypatch.setattr(payment_queue, 'get_sqs', FakeSqs)
+    queue = payment_queue.SqsQueue('https://sqs.us-east-1.amazonaws.com/1/payments.fifo')
+    queue.send(CHECKOUT_EVENT, deduplication_id='evt_1', group_id='application-1')
+    queue.send(CHECKOUT_EVENT, deduplication_id='evt_2')
+
+    assert [(ii['MessageGroupId'], ii['MessageDeduplicationId']) for ii in sent] == [
+        ('application-1', 'evt_1'), ('evt_2', 'evt_2')
+    ]
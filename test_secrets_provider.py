@@ -0,0 +1,54 @@
+import base64
+
+import pytest
+
+import secrets_provider
+
+
+class FakeKMS:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def decrypt(self, CiphertextBlob, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('kms unavailable')
+        return {'Plaintext': CiphertextBlob[::-1]}
+
+
+@pytest.fixture
+def kms(monkeypatch):
+    kms = FakeKMS()
+    monkeypatch.setattr(secrets_provider, 'get_kms', lambda: kms)
+    secrets_provider.clear_secrets()
+    yield kms
+    secrets_provider.clear_secrets()
+
+
+def test_decrypted_secret_is_cached(kms, monkeypatch):
+    monkeypatch.setenv('TEST_SECRET', base64.b64encode(b'terces').decode())
+
+    assert secrets_provider.get_secret('TEST_SECRET') == 'secret'
+    assert secrets_provider.get_secret('TEST_SECRET') == 'secret'
+    assert kms.calls == 1
+
+
+def test_plaintext_secret_skips_kms(kms, monkeypatch):
+    monkeypatch.setenv('TEST_SECRET', 'sk_test_plain')
+
+    assert secrets_provider.get_secret('TEST_SECRET') == 'sk_test_plain'
+    assert kms.calls == 0
+
+
+def test_failed_decrypt_is_retried_after_fallback_ttl(kms, monkeypatch):
+    monkeypatch.setenv('TEST_SECRET', base64.b64encode(b'terces').decode())
+    monkeypatch.setattr(secrets_provider, 'SECRETS_FALLBACK_TTL', -1)
+    kms.fail = True
+
+    assert secrets_provider.get_secret('TEST_SECRET') == base64.b64encode(b'terces').decode()
+
+    kms.fail = False
+    assert secrets_provider.get_secret('TEST_SECRET') == 'secret'
+    assert kms.calls == 2
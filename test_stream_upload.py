@@ -0,0 +1,116 @@
+import base64
+import binascii
+
+import pytest
+
+from stream_upload import FileTooLargeError, iter_base64_chunks, upload_base64
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.calls = []
+        self.objects = {}
+        self.parts = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append('put_object')
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.calls.append('create_multipart_upload')
+        self.parts[Key] = []
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append('upload_part')
+        self.parts[Key].append(Body)
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        assert [part['PartNumber'] for part in MultipartUpload['Parts']] == list(range(1, len(self.parts[Key]) + 1))
+        self.objects[Key] = b''.join(self.parts[Key])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+
+
+def data_url(contents):
+    return 'data:application/pdf;base64,' + base64.b64encode(contents).decode()
+
+
+def test_iter_base64_chunks_decodes_in_steps():
+    contents = bytes(range(256)) * 10
+    encoded = data_url(contents)
+    start = encoded.find(';base64,') + 8
+
+    chunks = list(iter_base64_chunks(encoded, start, chunk_chars=400))
+
+    assert len(chunks) > 1
+    assert b''.join(chunks) == contents
+
+
+def test_small_file_uses_single_put():
+    client = FakeS3Client()
+    encoded = data_url(b'hello world')
+
+    upload_base64(client, 'bucket', 'key', encoded, start=encoded.find(';base64,') + 8, part_size=1024)
+
+    assert client.calls == ['put_object']
+    assert client.objects['key'] == b'hello world'
+
+
+def test_large_file_uses_multipart_upload():
+    client = FakeS3Client()
+    contents = bytes(range(256)) * 9
+    encoded = data_url(contents)
+
+    upload_base64(client, 'bucket', 'key', encoded, start=encoded.find(';base64,') + 8, part_size=1000)
+
+    assert client.calls.count('upload_part') == 3
+    assert client.calls[-1] == 'complete_multipart_upload'
+    assert client.objects['key'] == contents
+
+
+def test_too_large_file_is_rejected():
+    client = FakeS3Client()
+    encoded = data_url(b'x' * 5000)
+
+    with pytest.raises(FileTooLargeError):
+        upload_base64(client, 'bucket', 'key', encoded, start=encoded.find(';base64,') + 8,
+                      max_bytes=4000, part_size=1000)
+
+    assert client.calls == []
+
+
+def test_failed_part_aborts_multipart_upload():
+    client = FakeS3Client()
+    upload_part = client.upload_part
+
+    def flaky_upload_part(**kwargs):
+        if kwargs['PartNumber'] == 2:
+            raise IOError('connection reset')
+        return upload_part(**kwargs)
+
+    client.upload_part = flaky_upload_part
+    encoded = data_url(b'x' * 3000)
+
+    with pytest.raises(IOError):
+        upload_base64(client, 'bucket', 'key', encoded, start=encoded.find(';base64,') + 8, part_size=1000)
+
+    assert client.calls[-1] == 'abort_multipart_upload'
+    assert 'key' not in client.objects
+
+
+def test_line_wrapped_base64_is_decoded():
+    raw = bytes(range(256)) * 40
+    # 76 character lines, as base64.encodebytes and most mail/mime encoders produce
+    wrapped = 'data:application/pdf;base64,' + base64.encodebytes(raw).decode().replace('\n', '\r\n')
+    start = wrapped.find(';base64,') + 8
+
+    assert b''.join(iter_base64_chunks(wrapped, start, chunk_chars=100)) == raw
+
+
+def test_truncated_base64_is_rejected():
+    with pytest.raises(binascii.Error):
+        b''.join(iter_base64_chunks(base64.b64encode(b'abcd').decode()[:-2], chunk_chars=4))
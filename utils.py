@@ -1,99 +1,464 @@
 import os
 
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 
+import contextvars
+import csv
 import datetime
-import boto3
-import stripe
+import io
+import json
+import threading
 
-from config import SECTION_LIST
+from decimal import Decimal
+from functools import partial
+
+from aws_clients import LazyProxy, get_s3, get_ses, lazy_table
+from cache_utils import ExpiringLRUCache
+from log_utils import get_logger
+from metrics import timed
+from form_schema import FORM_SCHEMA
+from pagination import MAX_PAGE_SIZE, fetch_page
+from secrets_provider import get_stripe_api_key
 
 
 BUCKET_NAME = os.environ.get('USER_FILES_BUCKET')
 MAX_FILE_SIZE = os.environ.get('MAX_FILE_SIZE', 5)
+# same units as get_file_size so presigned uploads get the limit inline uploads get
+MAX_FILE_SIZE_BYTES = int(float(MAX_FILE_SIZE) * 1024 * 2014)
+UPLOAD_URL_EXPIRATION = int(os.environ.get('UPLOAD_URL_EXPIRATION', 900))
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', 4))
+DOWNLOAD_URL_EXPIRATION = int(os.environ.get('DOWNLOAD_URL_EXPIRATION', 300))
+# a cached url is handed out only while it has at least this many seconds left
+DOWNLOAD_URL_MIN_VALIDITY = int(os.environ.get('DOWNLOAD_URL_MIN_VALIDITY', 60))
+DOWNLOAD_CONCURRENCY = int(os.environ.get('DOWNLOAD_CONCURRENCY', 4))
+PRICE_CACHE_TTL = int(os.environ.get('PRICE_CACHE_TTL', 300))
+CUSTOM_PRICE_NEGATIVE_TTL = int(os.environ.get('CUSTOM_PRICE_NEGATIVE_TTL', 30))
+SCAN_SEGMENTS = int(os.environ.get('SCAN_SEGMENTS', 4))
+MAX_CUSTOM_PRICE_IMPORT_ROWS = int(os.environ.get('MAX_CUSTOM_PRICE_IMPORT_ROWS', 5000))
+# ses errors a retry won't fix
+SES_PERMANENT_ERRORS = ('MessageRejected', 'MailFromDomainNotVerified', 'ConfigurationSetDoesNotExist')
+# keeps the combined UpdateExpression well under DynamoDB's 4 KB expression limit
+MAX_BATCH_UPDATE_KEYS = int(os.environ.get('MAX_BATCH_UPDATE_KEYS', 100))
+
+# columns shown on the admin custom price screen
+CUSTOM_PRICE_ATTRIBUTE_NAMES = {
+    '#email': 'email',
+    '#price': 'price',
+    '#updated_at': 'updated_at',
+    '#updated_by': 'updated_by'
+}
+CUSTOM_PRICE_PROJECTION = ', '.join(CUSTOM_PRICE_ATTRIBUTE_NAMES)
+
+# what the dashboard lists per application, the whole item comes from /get-details
+APPLICATION_SUMMARY_ATTRIBUTE_NAMES = {
+    '#application_uuid': 'application_uuid',
+    '#application_name': 'application_name',
+    '#currentScreenName': 'currentScreenName',
+    '#submitted_date': 'submitted_date'
+}
+APPLICATION_SUMMARY_PROJECTION = ', '.join(APPLICATION_SUMMARY_ATTRIBUTE_NAMES)
+
+# application attribute -> attribute of its row in the portal summary table
+PORTAL_SUMMARY_FIELDS = {
+    'applicant_info.first_name': 'first_name',
+    'applicant_info.last_name': 'last_name',
+    'application_name': 'application_name',
+    'state_of_service': 'state_of_service',
+    'submitted_date': 'submitted_date'
+}
+
+# AWS handles are created on first use, so a cold start only pays for what the routed endpoint touches
+table = lazy_table(os.environ.get('TABLE', 'medicaid-details'))
+custom_price_table = lazy_table(os.environ.get('CUSTOM_PRICE_TABLE', 'TurbocaidCustomPrice-sps-dev-1'))
+stripe_price_table = lazy_table(os.environ.get('STRIPE_PRICE_TABLE', 'TurbocaidStripePrice-sps-dev-1'))
+payment_details_table = lazy_table(os.environ.get('STRIPE_PAYMENT_DETAILS_TABLE', 'StripePaymentDetails-sps-dev-1'))
+portal_summary_table = lazy_table(os.environ.get('PORTAL_SUMMARY_TABLE', 'TurbocaidPortalSummary-sps-dev-1'))
+
+s3 = LazyProxy('s3', get_s3)
+
+ses = LazyProxy('ses', get_ses)
+
+logger = get_logger(__name__)
+
+STANDARD_PRICE_KEY = 'standard_price'
+price_cache = ExpiringLRUCache(maxsize=int(os.environ.get('PRICE_CACHE_SIZE', 1024)))
+
+download_url_cache = ExpiringLRUCache(maxsize=int(os.environ.get('DOWNLOAD_URL_CACHE_SIZE', 1024)))
+
+
+_stripe_lock = threading.Lock()
+_stripe = None
+
+
+def get_stripe():
+    """The stripe module with a current api key, stripe itself is only imported on first use."""
+    global _stripe
+    if _stripe is None:
+        with _stripe_lock:
+            if _stripe is None:
+                import stripe
+                _stripe = stripe
+
+    _stripe.api_key = get_stripe_api_key()
+
+    return _stripe
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1', endpoint_url=os.getenv('ENDPOINT_URL'))
 
-table = dynamodb.Table(os.environ.get('TABLE', 'medicaid-details'))
-custom_price_table = dynamodb.Table(os.environ.get('CUSTOM_PRICE_TABLE', 'TurbocaidCustomPrice-sps-dev-1'))
-stripe_price_table = dynamodb.Table(os.environ.get('STRIPE_PRICE_TABLE', 'TurbocaidStripePrice-sps-dev-1'))
-payment_details_table = dynamodb.Table(os.environ.get('STRIPE_PAYMENT_DETAILS_TABLE', 'StripePaymentDetails-sps-dev-1'))
+def check_key_validity(key):
+    return FORM_SCHEMA.is_valid_key(key)
+
+
+def build_set_expression(updates, path=None, keep=()):
+    """
+    (UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+    setting every attribute -> value of `updates`, nested under the map
+    attribute `path` when one is given.
+
+    Attributes in `keep` are only set when missing, through if_not_exists.
+    """
+    names = {}
+    values = {}
+    expressions = []
+    prefix = ''
+    if path is not None:
+        names['#p'] = path
+        prefix = '#p.'
+    for ii, (attr, val) in enumerate(updates.items()):
+        target = f'{prefix}#a{ii}'
+        names[f'#a{ii}'] = attr
+        values[f':v{ii}'] = val
+        if attr in keep:
+            expressions.append(f'{target} = if_not_exists({target}, :v{ii})')
+        else:
+            expressions.append(f'{target} = :v{ii}')
+
+    return 'SET ' + ', '.join(expressions), names, values
+
+
+def update_application(email, application_uuid, summary_updates, **update_kwargs):
+    """
+    table.update_item on an application, mirroring `summary_updates` into
+    its portal summary row.
+
+    The write is conditional on the application existing, so only the first
+    write of an application takes a second round trip, which also creates
+    its summary row.
+    """
+    key = {'email': email, 'application_uuid': application_uuid}
+    try:
+        resp = table.update_item(Key=key, ConditionExpression='attribute_exists(application_uuid)', **update_kwargs)
+        created = False
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        resp = table.update_item(Key=key, **update_kwargs)
+        created = True
 
-s3 = boto3.resource('s3')
+    update_portal_summary(email, application_uuid, summary_updates, ensure_row=created)
 
-ses = boto3.client('ses', region_name='us-east-1')
+    return resp
 
 
-def check_key_validity(key):
-    inputs = [
-        "email",
-        "submitted_date",
-        "applicant_info.first_name",
-        "applicant_info.last_name",
-        "sidebarHistory",
-        "documents",
-        "application_uuid",
-        "currentScreenName",
-        "application_name"
-    ]
+def update_dynamodb(email, application_uuid, key, val, return_values='NONE'):
+    is_valid_key = check_key_validity(key)
+    if not is_valid_key:
+        logger.warning('Unrecognizable key', key=key)
+
+    expression, names, values = build_set_expression({key: val})
+    return update_application(
+        email,
+        application_uuid,
+        {key: val},
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        UpdateExpression=expression,
+        ReturnValues=return_values
+    )
 
-    for _inputs in SECTION_LIST:
-        inputs += _inputs['inputs']
 
-    if key in inputs:
-        return True
+def update_dynamodb_batch(email, application_uuid, updates, return_values='ALL_NEW'):
+    """Set every key -> value of `updates` with one combined UpdateExpression."""
+    for key in updates:
+        if not check_key_validity(key):
+            logger.warning('Unrecognizable key', key=key)
+
+    expression, names, values = build_set_expression(updates)
+    return update_application(
+        email,
+        application_uuid,
+        updates,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        UpdateExpression=expression,
+        ReturnValues=return_values
+    )
 
-    for _key in inputs:
-        if key.startswith(_key):
-            return True
 
+def upsert_detail(email, application_uuid, key, detail, preserve=('created_date', 'uuid')):
+    """
+    Write `detail` (a MedicaidDetail/UserInfo dict) under `key` in a single
+    round trip and return the whole updated item.
 
-def update_dynamodb(email, application_uuid, key, val):
+    When the key already holds a detail, the `preserve` fields keep their
+    stored values through if_not_exists. Otherwise the detail is stored as is.
+    """
     is_valid_key = check_key_validity(key)
     if not is_valid_key:
-        print ("=== Unrecognizable key:", key)
+        logger.warning('Unrecognizable key', key=key)
+
+    merge_expression, merge_names, merge_values = build_set_expression(detail, path=key, keep=preserve)
+    put_expression, put_names, put_values = build_set_expression({key: detail})
+
+    conditional_check_failed = table.meta.client.exceptions.ConditionalCheckFailedException
+    # the nested update needs an existing map and the plain SET must not clobber
+    # one written meanwhile, so retry once if we lose a race between the two
+    created_item = False
+    for _ in range(2):
+        try:
+            resp = table.update_item(
+                Key={'email': email, 'application_uuid': application_uuid},
+                ConditionExpression='attribute_exists(#p)',
+                ExpressionAttributeNames=merge_names,
+                ExpressionAttributeValues=merge_values,
+                UpdateExpression=merge_expression,
+                ReturnValues='ALL_NEW'
+            )
+            break
+        except conditional_check_failed:
+            pass
+
+        try:
+            resp = table.update_item(
+                Key={'email': email, 'application_uuid': application_uuid},
+                ConditionExpression='attribute_not_exists(#a0)',
+                ExpressionAttributeNames=put_names,
+                ExpressionAttributeValues=put_values,
+                UpdateExpression=put_expression,
+                ReturnValues='ALL_NEW'
+            )
+            # nothing but the key attributes and this key: the write created the application
+            created_item = set(resp['Attributes']) == {'email', 'application_uuid', key}
+            break
+        except conditional_check_failed:
+            pass
+    else:
+        raise RuntimeError(f'Could not update {key}, it keeps changing concurrently')
+
+    update_portal_summary(email, application_uuid, {key: detail}, ensure_row=created_item)
 
-    resp = table.update_item(
-        Key={'email': email, 'application_uuid': application_uuid},
-        ExpressionAttributeNames={ "#the_key": key },
-        ExpressionAttributeValues={ ":val_to_update": val },
-        UpdateExpression="SET #the_key = :val_to_update"
+    return resp
+
+
+def append_documents(email, application_uuid, documents):
+    return update_application(
+        email,
+        application_uuid,
+        {},
+        ExpressionAttributeNames={'#documents': 'documents'},
+        ExpressionAttributeValues={':documents': documents, ':empty': []},
+        UpdateExpression='SET #documents = list_append(if_not_exists(#documents, :empty), :documents)',
+        ReturnValues='ALL_NEW'
     )
 
-    return resp
 
+def item_response(resp):
+    """Shape an update_item ReturnValues=ALL_NEW response like get_details."""
+    return {
+        'Item': eliminate_sensitive_info(resp['Attributes']),
+        'ResponseMetadata': resp['ResponseMetadata']
+    }
+
+
+def application_status(submitted_date):
+    return 'submitted' if submitted_date else 'in_progress'
+
+
+def _summary_value(val):
+    if isinstance(val, dict) and 'value' in val:
+        return val['value']
+
+    return val
+
+
+def build_portal_summary(item):
+    summary = {
+        'email': item['email'],
+        'application_uuid': item['application_uuid'],
+        'status': application_status(item.get('submitted_date'))
+    }
+    for key, summary_key in PORTAL_SUMMARY_FIELDS.items():
+        if key in item:
+            summary[summary_key] = _summary_value(item[key])
+
+    return summary
+
+
+def update_portal_summary(email, application_uuid, updates, ensure_row=False):
+    """
+    Mirror the summary fields among `updates` into the portal summary table.
 
-def update_custom_price_dynamodb(email, key, val):
+    With `ensure_row` the row is written even without any summary field, so
+    that an application shows up in /get-users from the write that creates it.
+    """
+    fields = {
+        PORTAL_SUMMARY_FIELDS[key]: _summary_value(val)
+        for key, val in updates.items() if key in PORTAL_SUMMARY_FIELDS
+    }
+    if not fields and not ensure_row:
+        return
+
+    # an unsubmitted application is in progress unless its row already says otherwise
+    fields['status'] = application_status(fields.get('submitted_date'))
+    keep = () if 'submitted_date' in fields else ('status',)
+    expression, names, values = build_set_expression(fields, keep=keep)
+
+    try:
+        portal_summary_table.update_item(
+            Key={'email': email, 'application_uuid': application_uuid},
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            UpdateExpression=expression
+        )
+    except Exception:
+        logger.exception('Error updating portal summary', application_uuid=application_uuid)
+
+
+def thread_map(func, items, max_workers):
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        # each item runs in a copy of the caller's context so log lines keep its correlation id
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def parallel_scan(dynamodb_table, total_segments=SCAN_SEGMENTS, **scan_kwargs):
+    """
+    Scan every page of `dynamodb_table`, with one worker per segment.
+
+    Goes through the table's low level client, which is thread safe and
+    still converts items to python types for tables of a dynamodb resource.
+    """
+    client = dynamodb_table.meta.client
+
+    def _scan_segment(segment):
+        kwargs = dict(scan_kwargs, TableName=dynamodb_table.name)
+        if total_segments > 1:
+            kwargs.update(Segment=segment, TotalSegments=total_segments)
+
+        items = []
+        while True:
+            resp = client.scan(**kwargs)
+            items += resp['Items']
+            if 'LastEvaluatedKey' not in resp:
+                return items
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    items = []
+    for segment_items in thread_map(_scan_segment, range(total_segments), total_segments):
+        items += segment_items
+
+    return items
+
+
+def update_custom_price_dynamodb(email, updates, return_values='NONE'):
+    expression, names, values = build_set_expression(updates)
     resp = custom_price_table.update_item(
         Key={'email': email},
-        ExpressionAttributeNames={ "#the_key": key },
-        ExpressionAttributeValues={ ":val_to_update": val },
-        UpdateExpression="SET #the_key = :val_to_update"
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        UpdateExpression=expression,
+        ReturnValues=return_values
     )
 
     return resp
 
 
-def get_price_detail(email):
-    try:
-        record = custom_price_table.get_item(
-            Key={
-                'email': email
-            },
-            ConsistentRead=True,
-            ReturnConsumedCapacity='NONE',
-        )['Item']
-    except KeyError:
-        record = stripe_price_table.scan(
+def parse_custom_prices(event_body):
+    """
+    Rows of a bulk custom price import, given either as a `prices` list of
+    {email, price} objects or as `csv` text with an email,price header.
+    `price` is a stripe price id. Returns None when any row is incomplete.
+    """
+    if event_body.get('csv'):
+        rows = list(csv.DictReader(io.StringIO(event_body['csv'].strip())))
+    else:
+        rows = event_body.get('prices') or []
+
+    prices = {}
+    for row in rows:
+        if not isinstance(row, dict):
+            return None
+        email = row.get('email')
+        price = row.get('price')
+        if not isinstance(email, str) or not isinstance(price, str):
+            return None
+        email = email.strip()
+        price = price.strip()
+        if not email or not price:
+            return None
+        prices[email] = price
+
+    return prices
+
+
+def import_custom_prices(prices, updated_by):
+    now = datetime.datetime.now().isoformat()
+    with custom_price_table.batch_writer() as batch:
+        for email, price in prices.items():
+            batch.put_item(Item={
+                'email': email,
+                'price': price,
+                'updated_by': updated_by,
+                'updated_at': now
+            })
+
+    for email in prices:
+        invalidate_price_cache(email)
+
+
+def get_standard_price():
+    record = price_cache.get(STANDARD_PRICE_KEY)
+    if record is None:
+        record = parallel_scan(
+            stripe_price_table,
+            total_segments=1,
             ConsistentRead=True,
             ReturnConsumedCapacity='NONE',
             FilterExpression='standard = :standard',
             ExpressionAttributeValues={':standard': 1}
-        )['Items'][0]
-        
-    return record
+        )[0]
+        price_cache.set(STANDARD_PRICE_KEY, record, ttl=PRICE_CACHE_TTL)
+
+    return dict(record)
+
+
+def get_price_detail(email):
+    # custom prices are always read, only the fact that a user has none is cached
+    if price_cache.get(('no_custom_price', email)) is None:
+        try:
+            return custom_price_table.get_item(
+                Key={
+                    'email': email
+                },
+                ConsistentRead=True,
+                ReturnConsumedCapacity='NONE',
+            )['Item']
+        except KeyError:
+            price_cache.set(('no_custom_price', email), True, ttl=CUSTOM_PRICE_NEGATIVE_TTL)
+
+    return get_standard_price()
+
+
+def invalidate_price_cache(email=None):
+    """Forget that `email` has no custom price, or everything including the standard price."""
+    if email is None:
+        price_cache.clear()
+    else:
+        price_cache.pop(('no_custom_price', email))
 
 
 def eliminate_sensitive_info(record):
@@ -102,8 +467,8 @@ def eliminate_sensitive_info(record):
         for ii in record['documents']:
             try:
                 ii.pop('s3_location')
-            except KeyError as err:
-                print('ERROR : no s3 location')  
+            except KeyError:
+                logger.warning('Document without s3 location', document_uuid=ii.get('uuid'))
             _documents.append(ii)
         record['documents'] = _documents
 
@@ -118,13 +483,13 @@ def get_details(email, application_uuid):
         ConsistentRead=True,
         ReturnConsumedCapacity='NONE',
     )
-    print(f'the record is str({record})')
     resp = {
         'Item': eliminate_sensitive_info(record['Item']),
         'ResponseMetadata': record['ResponseMetadata']
     }
 
-    print(f'the get details response is {str(resp)}')
+    # attribute names only, the values hold the applicant's personal details
+    logger.debug('Read application details', application_uuid=application_uuid, attributes=sorted(resp['Item']))
 
     return resp
 
@@ -133,28 +498,56 @@ def get_db_value(email, key_to_update, application_uuid):
     return get_details(email, application_uuid)['Item'].get(key_to_update, None)
 
 
-def is_list_type(key_to_update):
-    array_types = [
-        'contacts',
-        'previous_addresses',
-        'documents',
-        'general.vehicles',
-        'general-vehicles',
-        'employment_income.income_employment_details',
-        'employment_income-income_employment_details',
-        'insurance_policies.insurance_policies_details',
-        'insurance_policies-insurance_policies_details',
-        'general.properties',
-        'general-properties',
-        'general.property_proceeds',
-        'general-property_proceeds',
-        'financials.account_details',
-        'financials-account_details',
-        'financials.life_insurance_stocks_details',
-        'financials-life_insurance_stocks_details'
-    ]
+def get_db_values(email, application_uuid, keys):
+    """Consistent read of only `keys` of an application, missing keys are left out."""
+    names = {f'#k{ii}': key for ii, key in enumerate(keys)}
+    record = table.get_item(
+        Key={
+            'email': email, 'application_uuid': application_uuid
+        },
+        ConsistentRead=True,
+        ReturnConsumedCapacity='NONE',
+        ProjectionExpression=', '.join(names),
+        ExpressionAttributeNames=names
+    )
+
+    return record.get('Item', {})
+
+
+def get_application_summaries(email, cursor=None, limit=None):
+    """
+    Summaries of a user's applications, one page of them when `limit` is
+    given and every one of them otherwise.
+    """
+    def _page(cursor, limit):
+        page = fetch_page(
+            table.query,
+            cursor,
+            limit=limit,
+            KeyConditionExpression='email = :email',
+            ExpressionAttributeValues={':email': email},
+            ProjectionExpression=APPLICATION_SUMMARY_PROJECTION,
+            ExpressionAttributeNames=APPLICATION_SUMMARY_ATTRIBUTE_NAMES
+        )
+        for ii in page['Items']:
+            ii['status'] = application_status(ii.get('submitted_date'))
+
+        return page
+
+    if limit:
+        return _page(cursor, limit)
+
+    items = []
+    while True:
+        page = _page(cursor, MAX_PAGE_SIZE)
+        items += page['Items']
+        cursor = page['NextCursor']
+        if cursor is None:
+            return items
 
-    return key_to_update in array_types
+
+def is_list_type(key_to_update):
+    return FORM_SCHEMA.is_list_type(key_to_update)
 
 
 def delete_document_info_from_database(user_email, event_body, application_uuid):
@@ -170,13 +563,28 @@ def delete_document_info_from_database(user_email, event_body, application_uuid)
     return resp
 
 
-def handle_successful_payment(checkout_session):  
-    email = checkout_session.customer_email
-    application_uuid = checkout_session.client_reference_id
+def handle_successful_payment(checkout_session):
+    email = checkout_session['customer_email']
+    application_uuid = checkout_session['client_reference_id']
+
+    steps = [
+        partial(save_payment_info, email, application_uuid, checkout_session),
+        partial(send_completed_application_email, email, application_uuid),
+        partial(update_application_status, email, application_uuid)
+    ]
 
-    save_payment_info(email, application_uuid, checkout_session)
-    send_completed_application_email(email, application_uuid)
-    update_application_status(email, application_uuid)
+    def _run_step(step):
+        # one failing step doesn't stop the others, every step is safe to run again
+        try:
+            step()
+        except Exception as err:
+            logger.exception('Error finalizing payment', application_uuid=application_uuid, step=step.func.__name__)
+            return err
+
+    errors = [err for err in thread_map(_run_step, steps, len(steps)) if err is not None]
+    if errors:
+        # the payment worker leaves the event queued and it is processed again
+        raise errors[0]
 
 
 def get_file_size(b64string):
@@ -186,6 +594,76 @@ def get_file_size(b64string):
     return mb_size
 
 
+def create_upload_url(key, content_type, method='POST'):
+    """
+    Presigned request letting the browser upload `key` straight to S3.
+
+    A POST policy lets S3 itself enforce MAX_FILE_SIZE_BYTES. A PUT url can't,
+    so its declared size is checked up front and the stored size again when
+    the upload is finalized.
+    """
+    if method == 'POST':
+        post = s3.meta.client.generate_presigned_post(
+            BUCKET_NAME,
+            key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, MAX_FILE_SIZE_BYTES]
+            ],
+            ExpiresIn=UPLOAD_URL_EXPIRATION
+        )
+
+        return {'method': 'POST', 'url': post['url'], 'fields': post['fields']}
+
+    url = s3.meta.client.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': BUCKET_NAME,
+            'Key': key,
+            'ContentType': content_type
+        },
+        ExpiresIn=UPLOAD_URL_EXPIRATION
+    )
+
+    return {'method': 'PUT', 'url': url, 'headers': {'Content-Type': content_type}}
+
+
+def get_download_url(key):
+    url = download_url_cache.get(key)
+    if url is None:
+        url = s3.meta.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': key},
+            ExpiresIn=DOWNLOAD_URL_EXPIRATION
+        )
+        download_url_cache.set(key, url, ttl=DOWNLOAD_URL_EXPIRATION - DOWNLOAD_URL_MIN_VALIDITY)
+
+    return url
+
+
+def get_file_contents(key):
+    return s3.meta.client.get_object(Bucket=BUCKET_NAME, Key=key)['Body'].read()
+
+
+def get_uploaded_file_size(key):
+    """Size in bytes of an uploaded object, None when it is not there."""
+    try:
+        return s3.meta.client.head_object(Bucket=BUCKET_NAME, Key=key)['ContentLength']
+    except s3.meta.client.exceptions.ClientError as err:
+        if err.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+def get_file_key(email, application_uuid, document_type, file_name):
+    return f'{email}/{application_uuid}/{document_type}/{file_name}'
+
+
+def get_s3_location(key):
+    return f'https://{BUCKET_NAME}.s3.amazonaws.com/{key}'
+
+
 def send_email(subject, to_emails, body, attachment_string=None):
     message = MIMEMultipart()
     message['Subject'] = subject
@@ -231,42 +709,74 @@ def send_email(subject, to_emails, body, attachment_string=None):
 
 #     return resp
 
+
 def send_completed_application_email(user_email, application_uuid):
-    try: 
-        subject = 'Turbocaid Application Summary'
-        to_emails = os.environ.get('TO_EMAILS', 'jason.5001001@gmail.com')
-        applicant_first_name = get_db_value(user_email, 'applicant_info.first_name', application_uuid)['value']
-        applicant_last_name = get_db_value(user_email, 'applicant_info.last_name', application_uuid)['value']
-        email_body = f'{applicant_first_name} {applicant_last_name} submitted application. Email: {user_email}. Application Id: {application_uuid}'
-
-        resp = send_email(subject, to_emails, email_body)
+    """Email the submitted application to TO_EMAILS, only once when a payment is processed again."""
+    sent = payment_details_table.get_item(
+        Key={'email': user_email, 'application_uuid': application_uuid},
+        ProjectionExpression='#sent',
+        ExpressionAttributeNames={'#sent': 'completed_email_sent_date'}
+    ).get('Item')
+    if sent:
+        return
+
+    subject = 'Turbocaid Application Summary'
+    to_emails = os.environ.get('TO_EMAILS', 'jason.5001001@gmail.com')
+    keys = ['applicant_info.first_name', 'applicant_info.last_name']
+    details = get_db_values(user_email, application_uuid, keys)
+    # an applicant may pay before saving a name, which must not hold the email back
+    names = [details[key].get('value') for key in keys if isinstance(details.get(key), dict)]
+    applicant_name = ' '.join(str(name) for name in names if name) or 'An applicant'
+    email_body = f'{applicant_name} submitted application. Email: {user_email}. Application Id: {application_uuid}'
+
+    try:
+        send_email(subject, to_emails, email_body)
     except Exception as err:
-        print('Error sending email with completed application info ' + str(err))
+        code = getattr(err, 'response', {}).get('Error', {}).get('Code')
+        if code not in SES_PERMANENT_ERRORS:
+            raise
+        # retrying can't fix these, so the payment isn't held back either
+        logger.exception('Completed application email rejected', application_uuid=application_uuid, code=code)
+        return
+
+    payment_details_table.update_item(
+        Key={'email': user_email, 'application_uuid': application_uuid},
+        ExpressionAttributeNames={'#sent': 'completed_email_sent_date'},
+        ExpressionAttributeValues={':now': datetime.datetime.now().isoformat()},
+        UpdateExpression='SET #sent = :now'
+    )
 
 
 def update_application_status(user_email, application_uuid):
-    try:
-        key_to_update = 'submitted_date'
-        now = datetime.datetime.now().isoformat()
+    """Set submitted_date, calling it again keeps the first date."""
+    resp = table.update_item(
+        Key={'email': user_email, 'application_uuid': application_uuid},
+        ExpressionAttributeNames={'#submitted_date': 'submitted_date'},
+        ExpressionAttributeValues={':now': datetime.datetime.now().isoformat()},
+        UpdateExpression='SET #submitted_date = if_not_exists(#submitted_date, :now)',
+        ReturnValues='UPDATED_NEW'
+    )
 
-        resp = update_dynamodb(user_email, application_uuid, key_to_update, now)
+    update_portal_summary(user_email, application_uuid, {'submitted_date': resp['Attributes']['submitted_date']})
 
-        return resp        
-    except Exception as err:
-        print('Error updating application status ' + str(err))
+    return resp
 
 
 def save_payment_info(user_email, application_uuid, checkout_session):
-    try:
-        payment_intent = stripe.PaymentIntent.retrieve(
-            checkout_session.payment_intent
-        )
-        resp = payment_details_table.update_item(
-            Key={'email': user_email, 'application_uuid': application_uuid},
-            ExpressionAttributeNames={ "#the_key": 'details' },
-            ExpressionAttributeValues={ ":val_to_update": payment_intent },
-            UpdateExpression="SET #the_key = :val_to_update"
-        )    
-    except Exception as err:
-        print('Error retrieving and saving stripe payment info ' + str(err))
+    payment_intent = checkout_session['payment_intent']
+    # sessions retrieved with expand=['payment_intent'] already carry it,
+    # the ones in webhook events only have its id
+    if isinstance(payment_intent, str):
+        with timed('stripe'):
+            payment_intent = get_stripe().PaymentIntent.retrieve(payment_intent)
+    # stripe objects render themselves as json, dynamodb wants plain dicts with Decimal rather than float
+    payment_intent_json = json.dumps(payment_intent) if isinstance(payment_intent, dict) else str(payment_intent)
+    payment_intent = json.loads(payment_intent_json, parse_float=Decimal)
+    resp = payment_details_table.update_item(
+        Key={'email': user_email, 'application_uuid': application_uuid},
+        ExpressionAttributeNames={ "#the_key": 'details' },
+        ExpressionAttributeValues={ ":val_to_update": payment_intent },
+        UpdateExpression="SET #the_key = :val_to_update"
+    )
 
+    return resp